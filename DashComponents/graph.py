@@ -1,5 +1,6 @@
 import dash
 import time
+import itertools
 from collections import deque
 
 from dash import dcc, Input, html
@@ -11,12 +12,17 @@ class ZMQGraph:
     '''
         This class implements a graph that displays the data throughput of the zmq messages.
     '''
-    def __init__(self, zqmSubscriber: ZmqSubscriber, historyPoints: int = 100, filterIds: List[str] | None = None):
+    def __init__(self, zqmSubscriber: ZmqSubscriber, historyPoints: int = 100, filterIds: List[str] | None = None,
+                 backfillSeconds: float | None = None):
         self.zqmSubscriber = zqmSubscriber
         self.startTime = time.time()
         self.historyPoints = historyPoints
         self.history = deque(maxlen=self.historyPoints)
         self.filterIds = filterIds
+        # How far back to load the persisted metrics when the graph is shown, defaults to one point per second
+        self.backfillSeconds = backfillSeconds if backfillSeconds is not None else historyPoints
+        # Kept apart from the live history so the live points do not push it out
+        self.backfillHistory = []
 
     def graph_layout(self, id: str) -> dcc.Graph:
         return html.Div([
@@ -27,7 +33,34 @@ class ZMQGraph:
     def getPageLoadTrigger(self) -> Input:
         return Input('page-load-trigger-graph', 'value')
 
+    def _createGraphData(self, uuid: str, x: float, messageRate: float, payloadRate: float) -> List[dict]:
+        return [
+            {'x': (x, ), 'y': (messageRate, ), 'mode': 'lines+markers', 'name': f'{uuid}-Message Rate'},
+            {'x': (x, ), 'yaxis': 'y2', 'y': (payloadRate, ), 'mode': 'lines+markers', 'name': f'{uuid}-Payload Rate (KB/s)'},
+        ]
+
+    def backfill(self) -> None:
+        '''
+            Loads the persisted metrics of the last backfillSeconds that are older than the live history, including the
+            ones of a previous run.
+        '''
+        uuids = self.filterIds if self.filterIds is not None else self.zqmSubscriber.getUUIDs()
+        # The x axis is relative to the start time, the live history starts at its oldest point
+        endTime = self.startTime + self.history[0][0]['x'][0] if len(self.history) else time.time()
+        history = self.zqmSubscriber.getMetricsHistory(uuids, time.time() - self.backfillSeconds, endTime,
+                                                       maxPoints=self.historyPoints)
+        # The metrics of all the uuids are sampled at the same time, group them into one history entry per time
+        samplesByTime = {}
+        for uuid, samples in history.items():
+            for timestamp, messageRate, payloadRate in samples:
+                samplesByTime.setdefault(timestamp, []).extend(
+                    self._createGraphData(uuid, timestamp - self.startTime, messageRate, payloadRate))
+        self.backfillHistory = [samplesByTime[timestamp] for timestamp in sorted(samplesByTime)]
+
     def update_graph(self, n: int, *args) -> dict:
+        # Reload the persisted metrics every time the page is loaded, the refreshes only add live points
+        if dash.ctx.triggered_id in (None, 'page-load-trigger-graph'):
+            self.backfill()
         # Get the metrics from the zmq subscriber
         try:
             metrics = self.zqmSubscriber.getMetrics(self.filterIds)
@@ -41,16 +74,7 @@ class ZMQGraph:
 
         for uuid, metric in metrics.items():
             # Time is the x axis in seconds
-            x_values = (time.time() - self.startTime, )
-            message_rates = (metric['message_rate'], )
-            payload_rates = (metric['payload_rate'], )
-
-            graph_data.append(
-                {'x': x_values, 'y': message_rates, 'mode': 'lines+markers', 'name': f'{uuid}-Message Rate'}
-            )
-            graph_data.append(
-                {'x': x_values, 'yaxis': 'y2', 'y': payload_rates, 'mode': 'lines+markers', 'name': f'{uuid}-Payload Rate (KB/s)'}
-            )
+            graph_data.extend(self._createGraphData(uuid, time.time() - self.startTime, metric['message_rate'], metric['payload_rate']))
 
         graph_layout = {
             'title': 'Data Throughput Metrics',
@@ -67,7 +91,7 @@ class ZMQGraph:
         # Merge the data from the history to a single dictionary.
         # Only merge the same names together
         rolling_history = {}
-        for gData in self.history:
+        for gData in itertools.chain(self.backfillHistory, self.history):
             for data in gData:
                 if data['name'] not in rolling_history:
                     rolling_history[data['name']] = {'x': list(data['x']), 'y': list(data['y']), 'mode': data['mode'], 'name': data['name'], 'yaxis': data.get('yaxis', 'y')}
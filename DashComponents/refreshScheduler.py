@@ -0,0 +1,106 @@
+import dash
+from dash import dcc, callback, clientside_callback, Input, Output, State
+from typing import Callable, List, Tuple
+
+from src.diagnostics import Diagnostics
+
+# Client side only interval that checks whether the browser tab is visible, it never sends a request to the server
+VISIBILITY_INTERVAL_ID = 'visibility-interval'
+
+
+def visibilityLayout() -> dcc.Interval:
+    '''
+        Has to be placed once in the app layout for the schedulers to pause on hidden tabs.
+    '''
+    return dcc.Interval(id=VISIBILITY_INTERVAL_ID, interval=1000, n_intervals=0)
+
+
+def registerVisibilityPause(intervalId: str) -> None:
+    '''
+        Disables a dcc.Interval while the tab is hidden. Runs in the browser so it costs the server nothing.
+
+        The callback owns the disabled prop of the interval, it can not be used on an interval that is enabled and
+        disabled by a server side callback.
+    '''
+    clientside_callback(
+        '''
+        function(n, disabled) {
+            if (Boolean(disabled) === document.hidden) {
+                return window.dash_clientside.no_update;
+            }
+            return document.hidden;
+        }
+        ''',
+        Output(intervalId, 'disabled'),
+        Input(VISIBILITY_INTERVAL_ID, 'n_intervals'),
+        State(intervalId, 'disabled'))
+
+
+class RefreshScheduler:
+    '''
+        Adapts the rate of a dcc.Interval to the data it refreshes.
+
+        The interval starts at baseInterval and doubles, up to maxInterval, every tick the sequence number of the
+        data did not change. It goes back to baseInterval as soon as the sequence number changes. The interval is
+        disabled while the browser tab is hidden (Page Visibility API).
+
+        The state is kept in a dcc.Store next to the interval so every browser tab backs off on its own.
+    '''
+    def __init__(self, intervalId: str, baseInterval: int, maxInterval: int | None = None, backoff: float = 2):
+        self.intervalId = intervalId
+        self.baseInterval = baseInterval
+        self.maxInterval = maxInterval if maxInterval is not None else max(baseInterval, 10000)
+        self.backoff = backoff
+        self.stateId = f'{intervalId}-refresh-state'
+        self.triggerId = f'{intervalId}-refresh-trigger'
+
+    def layout(self) -> List:
+        return [
+            dcc.Interval(id=self.intervalId, interval=self.baseInterval, n_intervals=0),
+            dcc.Store(id=self.stateId),
+            dcc.Store(id=self.triggerId),
+        ]
+
+    def getStateInput(self) -> State:
+        return State(self.stateId, 'data')
+
+    def getIntervalOutputs(self) -> List[Output]:
+        return [Output(self.intervalId, 'interval'), Output(self.stateId, 'data')]
+
+    def getTriggerInput(self) -> Input:
+        '''
+            Input that only fires when the sequence number changed, see registerTriggerCallback.
+        '''
+        return Input(self.triggerId, 'data')
+
+    def nextState(self, state: dict | None, sequence) -> Tuple[bool, int, dict]:
+        '''
+            Returns whether the data changed, the interval to set (dash.no_update if it did not change) and the new state.
+        '''
+        if state is None or state['sequence'] != sequence:
+            interval = self.baseInterval
+            changed = True
+        else:
+            interval = min(state['interval'] * self.backoff, self.maxInterval)
+            changed = False
+        previousInterval = state['interval'] if state is not None else self.baseInterval
+        return changed, interval if interval != previousInterval else dash.no_update, {'sequence': sequence, 'interval': interval}
+
+    def registerVisibilityPause(self) -> None:
+        registerVisibilityPause(self.intervalId)
+
+    def registerTriggerCallback(self, getSequence: Callable[[], any]) -> None:
+        '''
+            Drives the interval with getSequence and updates the trigger store only when the sequence changed, so the
+            callbacks listening on getTriggerInput run once per change instead of once per tick. getSequence has to
+            return a json serializable value that only changes with the data, e.g. a list of statuses.
+        '''
+        @callback(
+            [Output(self.triggerId, 'data')] + self.getIntervalOutputs(),
+            Input(self.intervalId, 'n_intervals'),
+            self.getStateInput())
+        @Diagnostics().instrumentCallback(f'refreshScheduler[{self.intervalId}]')
+        def updateRefreshTrigger(n, state):
+            sequence = getSequence()
+            changed, interval, state = self.nextState(state, sequence)
+            return sequence if changed else dash.no_update, interval, state
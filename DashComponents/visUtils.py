@@ -3,12 +3,14 @@ from dash import html, dcc, callback
 from dash.dependencies import Output, State, Input
 
 from src.zmqUtils import ZmqSubscriber
+from src.diagnostics import Diagnostics
 from DashComponents.configUtils import createHumanReadableNames, createServernamePortTopicListDict
 from DashComponents.dataViewer import StringVeiwer, ImageVeiwer, DataViewer
+from DashComponents.refreshScheduler import RefreshScheduler
 
 from typing import Callable, List, Dict, ByteString, Tuple
 
-def setupDefaultVisUi(zmqId: str, interval: int = 1000 * 3):
+def setupDefaultVisUi(zmqId: str, scheduler: RefreshScheduler):
     return html.Div([
         dcc.Input(id=f'page-load-trigger-{zmqId}', style={'display': 'none'}),
         html.H1(f"ZMQ Message Viewer: {zmqId}"),
@@ -19,19 +21,28 @@ def setupDefaultVisUi(zmqId: str, interval: int = 1000 * 3):
             html.Div(id=f'zmq-data-{zmqId}'),
         ]),
 
-        dcc.Interval(id=f'{zmqId}-interval-component', interval=interval, n_intervals=0),
+        *scheduler.layout(),
     ])
 
-def registerZmqVisCallbacks(zmqId: str, zqmSubscriber: ZmqSubscriber):
+def registerZmqVisCallbacks(zmqId: str, zqmSubscriber: ZmqSubscriber, scheduler: RefreshScheduler):
     dataType = zqmSubscriber.getDataType(zmqId).lower()
     dataObject = ImageVeiwer(zmqId=zmqId) if dataType == 'image' else StringVeiwer(zmqId=zmqId) if dataType == 'string' else DataViewer(zmqId=zmqId)
+    scheduler.registerVisibilityPause()
     @callback(
-        Output(f'zmq-data-{zmqId}', 'children'),
+        [Output(f'zmq-data-{zmqId}', 'children')] + scheduler.getIntervalOutputs(),
         [Input(f'page-load-trigger-{zmqId}', 'value'),
-            Input(f'{zmqId}-interval-component', 'n_intervals')])
-    def updateZmqData(n, *args):
-        dataObject.update(zqmSubscriber.getMostRecentData(zmqId))
-        return dataObject.display()
+            Input(f'{zmqId}-interval-component', 'n_intervals')],
+        scheduler.getStateInput())
+    @Diagnostics().instrumentCallback(f'updateZmqData[{zmqId}]')
+    def updateZmqData(n, nIntervals, state):
+        # Only render when a new message arrived, the interval backs off while the topic is quiet
+        changed, interval, state = scheduler.nextState(state, zqmSubscriber.getSequenceNumber(zmqId))
+        data = zqmSubscriber.getMostRecentData(zmqId)
+        # Nothing to show before the first message, the state is still saved so the interval backs off
+        if not changed or data is None:
+            return dash.no_update, interval, state
+        dataObject.update(data)
+        return dataObject.display(), interval, state
 
 def dynamicallyCreateVis(serverConfig: List[Dict], zqmSubscriber: ZmqSubscriber):
     pathNames = createHumanReadableNames(serverConfig)
@@ -39,5 +50,6 @@ def dynamicallyCreateVis(serverConfig: List[Dict], zqmSubscriber: ZmqSubscriber)
     for pathName, rawValues in pathNames:
         zmqId = zqmSubscriber.lookupUUID(rawValues['ip'], rawValues['port'], rawValues['topic'])
         updateRate = rawValues.get('UpdateRate', 3) * 1000
-        dash.register_page(zmqId, path=pathName, layout=setupDefaultVisUi(zmqId, updateRate))
-        registerZmqVisCallbacks(zmqId, zqmSubscriber)
\ No newline at end of file
+        scheduler = RefreshScheduler(f'{zmqId}-interval-component', updateRate)
+        dash.register_page(zmqId, path=pathName, layout=setupDefaultVisUi(zmqId, scheduler))
+        registerZmqVisCallbacks(zmqId, zqmSubscriber, scheduler)
\ No newline at end of file
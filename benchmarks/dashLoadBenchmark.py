@@ -0,0 +1,389 @@
+'''
+    Load test of the dash server with many simulated viewers.
+
+    Starts main.py against a synthetic publisher and replays the _dash-update-component requests a browser would send
+    for the table, graph and topic pages, from N clients at the rates the intervals of the pages run at. Every client
+    behaves like a small dash renderer: it only fires the callbacks whose outputs are in the layout of its page, fires
+    them when their interval ticks, follows the interval changes the server sends back and fires the callbacks
+    depending on the props that were updated.
+
+    Reports the latency percentiles and the share of requests slower than their interval per page, the throughput
+    and the cpu and memory used by the server.
+
+    Usage: python benchmarks/dashLoadBenchmark.py --clients 20 --duration 30 --output bench.json
+'''
+import os
+import sys
+import json
+import time
+import random
+import threading
+import subprocess
+import http.client
+from collections import defaultdict
+from typing import Tuple
+
+import zmq
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from DashComponents.configUtils import readConfig, createServernamePortTopicListDict, createHumanReadableNames
+
+PAGES = ('table', 'graph', 'topic')
+
+
+def argParse():
+    import argparse
+    parser = argparse.ArgumentParser(description='Load test the ZMQ Message Viewer with simulated viewers')
+    parser.add_argument('--clients', type=int, default=10, help='Number of simulated browser tabs')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds to run the load for')
+    parser.add_argument('--pages', type=str, nargs='*', default=list(PAGES), choices=PAGES, help='Pages the clients are spread over')
+    parser.add_argument('--port', type=int, default=8099, help='Port to start the server on')
+    parser.add_argument('--url', type=str, default=None, help='Use a running server (e.g. http://localhost:8050) instead of starting one')
+    parser.add_argument('--pid', type=int, default=None, help='Pid of the running server, to report its cpu and memory')
+    parser.add_argument('--server_config', type=str, default='configs/monitorConfig.yaml', help='Server configuration the app is started with')
+    parser.add_argument('--publish_rate', type=float, default=50, help='Messages per second sent on every topic, 0 to not publish')
+    parser.add_argument('--output', type=str, default=None, help='Write the report as json to this file')
+    return parser.parse_args()
+
+
+def publish(port: int, topics: list, rate: float, stop: threading.Event):
+    '''
+        Synthetic publisher sending every topic at the given rate on a port.
+    '''
+    context = zmq.Context.instance()
+    socket = context.socket(zmq.PUB)
+    socket.bind(f'tcp://*:{port}')
+    counter = 0
+    while not stop.is_set():
+        for topic in topics:
+            socket.send_string(f'{topic} order_id={counter} payload={"x" * random.randint(16, 256)}')
+        counter += 1
+        time.sleep(1 / rate)
+    socket.close()
+
+
+def parseOutputs(output: str) -> list:
+    '''
+        Splits the output of a dependency, "id.prop" or "..id.prop...id.prop.." for multiple outputs.
+    '''
+    outputs = output[2:-2].split('...') if output.startswith('..') else [output]
+    return [dict(zip(('id', 'property'), item.rsplit('.', 1))) for item in outputs]
+
+
+class Callback:
+    def __init__(self, dependency: dict, page: str | None = None):
+        self.output = dependency['output']
+        self.outputs = parseOutputs(self.output)
+        self.multi = self.output.startswith('..')
+        self.inputs = [(item['id'], item['property']) for item in dependency['inputs']]
+        self.state = [(item['id'], item['property']) for item in dependency.get('state', [])]
+        self.page = page
+
+    def body(self, props: dict, changed: list) -> dict:
+        return {
+            'output': self.output,
+            'outputs': self.outputs if self.multi else self.outputs[0],
+            'inputs': [{'id': id, 'property': prop, 'value': props.get(f'{id}.{prop}')} for id, prop in self.inputs],
+            'state': [{'id': id, 'property': prop, 'value': props.get(f'{id}.{prop}')} for id, prop in self.state],
+            'changedPropIds': changed,
+        }
+
+
+def collectProps(layout, props: dict) -> dict:
+    '''
+        Collects the initial props of the components with an id, like the renderer does when it receives a layout.
+    '''
+    if isinstance(layout, list):
+        for child in layout:
+            collectProps(child, props)
+    elif isinstance(layout, dict) and 'props' in layout:
+        id = layout['props'].get('id')
+        for prop, value in layout['props'].items():
+            if prop == 'children':
+                collectProps(value, props)
+            elif id is not None and isinstance(id, str):
+                props[f'{id}.{prop}'] = value
+    return props
+
+
+def classifyCallbacks(dependencies: list, uuids: list) -> Tuple[Callback, list]:
+    '''
+        Returns the callback rendering the pages and the other server side callbacks, labeled with what they refresh
+        for the report. Which of them a client fires depends on the components of its page, see SimulatedClient.
+    '''
+    pagesCallback = None
+    callbacks = []
+    for dependency in dependencies:
+        if dependency.get('clientside_function') is not None:
+            continue
+        callback = Callback(dependency, 'other')
+        inputIds = {id for id, prop in callback.inputs}
+        if '_pages_location' in inputIds:
+            callback.page = 'pages'
+            pagesCallback = callback
+            continue
+        if any(output['id'].endswith('-refresh-trigger') for output in callback.outputs):
+            callback.page = 'scheduler'
+        elif 'page-load-trigger-table' in inputIds:
+            callback.page = 'table'
+        elif 'page-load-trigger-graph' in inputIds:
+            callback.page = 'graph'
+        else:
+            for uuid in uuids:
+                if f'page-load-trigger-{uuid}' in inputIds:
+                    callback.page = f'topic:{uuid}'
+        callbacks.append(callback)
+    return pagesCallback, callbacks
+
+
+class SimulatedClient(threading.Thread):
+    '''
+        One browser tab showing a page until stop is set.
+    '''
+    def __init__(self, host: str, port: int, path: str, pagesCallback: Callback, callbacks: list, appProps: dict,
+                 stop: threading.Event, results: list):
+        super().__init__(daemon=True)
+        self.connection = http.client.HTTPConnection(host, port, timeout=30)
+        self.path = path
+        self.pagesCallback = pagesCallback
+        self.callbacks = callbacks
+        self.stop = stop
+        self.results = results
+        self.props = dict(appProps)
+        self.intervals = {}
+
+    def isOnPage(self, callback: Callback) -> bool:
+        '''
+            The renderer only fires the callbacks whose outputs are all in the layout.
+        '''
+        return all(f"{output['id']}.id" in self.props for output in callback.outputs)
+
+    def request(self, callback: Callback, changed: list, budget: float | None):
+        body = json.dumps(callback.body(self.props, changed))
+        start = time.perf_counter()
+        try:
+            self.connection.request('POST', '/_dash-update-component', body, {'Content-Type': 'application/json'})
+            response = self.connection.getresponse()
+            data = response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            self.connection.close()
+            data, status = b'', 0
+        latency = time.perf_counter() - start
+        self.results.append((callback.page.split(':')[0], latency, status, len(data), budget))
+        if status != 200:
+            return []
+        updated = []
+        for id, props in json.loads(data)['response'].items():
+            for prop, value in props.items():
+                if prop == 'children' and id == '_pages_content':
+                    collectProps(value, self.props)
+                self.props[f'{id}.{prop}'] = value
+                updated.append(f'{id}.{prop}')
+                if prop == 'interval' and id in self.intervals:
+                    self.intervals[id] = value / 1000
+        return updated
+
+    def fire(self, callbacks: list, changed: list, budget: float | None):
+        '''
+            Fires the callbacks and, like the dash renderer, the callbacks depending on the props they updated.
+        '''
+        pending = [(callback, changed) for callback in callbacks]
+        while pending and not self.stop.is_set():
+            callback, changed = pending.pop(0)
+            updated = self.request(callback, changed, budget)
+            for other in self.callbacks:
+                triggers = [f'{id}.{prop}' for id, prop in other.inputs if f'{id}.{prop}' in updated]
+                if triggers:
+                    pending.append((other, triggers))
+
+    def run(self):
+        # Render the page, then make the initial call of every callback of the page like the renderer
+        self.props['_pages_location.pathname'] = self.path
+        self.props['_pages_location.search'] = ''
+        self.request(self.pagesCallback, ['_pages_location.pathname'], None)
+        self.callbacks = [callback for callback in self.callbacks if self.isOnPage(callback)]
+        for id, prop in {input for callback in self.callbacks for input in callback.inputs}:
+            if prop == 'n_intervals':
+                self.intervals[id] = self.props.get(f'{id}.interval', 1000) / 1000
+                self.props.setdefault(f'{id}.n_intervals', 0)
+        self.fire(self.callbacks, [], None)
+        nextTick = {id: time.perf_counter() + period for id, period in self.intervals.items()}
+        while not self.stop.is_set():
+            id = min(nextTick, key=nextTick.get)
+            wait = nextTick[id] - time.perf_counter()
+            if wait > 0:
+                self.stop.wait(wait)
+            self.props[f'{id}.n_intervals'] += 1
+            period = self.intervals[id]
+            triggered = [callback for callback in self.callbacks if (id, 'n_intervals') in callback.inputs]
+            self.fire(triggered, [f'{id}.n_intervals'], period)
+            # dcc.Interval keeps ticking from when it was scheduled, not from when the request finished
+            nextTick[id] = max(nextTick[id] + self.intervals[id], time.perf_counter())
+
+
+class ProcessSampler(threading.Thread):
+    '''
+        Samples the cpu and memory of a process from /proc, only on linux.
+    '''
+    def __init__(self, pid: int, stop: threading.Event):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.stop = stop
+        self.samples = []
+
+    def read(self):
+        with open(f'/proc/{self.pid}/stat', 'r') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        cpu = (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+        with open(f'/proc/{self.pid}/status', 'r') as f:
+            rss = next(int(line.split()[1]) * 1024 for line in f if line.startswith('VmRSS'))
+        return time.time(), cpu, rss
+
+    def run(self):
+        while not self.stop.is_set():
+            try:
+                self.samples.append(self.read())
+            except (OSError, StopIteration):
+                return
+            self.stop.wait(1)
+
+    def summary(self) -> dict:
+        if len(self.samples) < 2:
+            return {}
+        (startTime, startCpu, _), (endTime, endCpu, _) = self.samples[0], self.samples[-1]
+        return {
+            'cpu_percent': (endCpu - startCpu) / (endTime - startTime) * 100,
+            'rss_mb_max': max(rss for _, _, rss in self.samples) / 1024 / 1024,
+            'rss_mb_end': self.samples[-1][2] / 1024 / 1024,
+        }
+
+
+def percentile(values: list, fraction: float) -> float:
+    if not values:
+        return 0.0
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def summarize(results: list, duration: float) -> dict:
+    pages = defaultdict(list)
+    for result in results:
+        pages[result[0]].append(result)
+    report = {}
+    for page, pageResults in sorted(pages.items()):
+        latencies = sorted(latency for _, latency, _, _, _ in pageResults)
+        report[page] = {
+            'requests': len(pageResults),
+            'requests_per_s': len(pageResults) / duration,
+            'errors': sum(1 for _, _, status, _, _ in pageResults if status not in (200, 204)),
+            'missed_interval': sum(1 for _, latency, _, _, budget in pageResults if budget and latency > budget) / len(pageResults),
+            'response_kb_per_s': sum(size for _, _, _, size, _ in pageResults) / 1024 / duration,
+            'p50_ms': percentile(latencies, 0.5) * 1000,
+            'p90_ms': percentile(latencies, 0.9) * 1000,
+            'p99_ms': percentile(latencies, 0.99) * 1000,
+            'max_ms': latencies[-1] * 1000,
+        }
+    return report
+
+
+def waitForServer(host: str, port: int, timeout: float = 60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            connection = http.client.HTTPConnection(host, port, timeout=2)
+            connection.request('GET', '/_dash-dependencies')
+            response = connection.getresponse()
+            if response.status == 200:
+                return json.loads(response.read())
+        except (OSError, http.client.HTTPException):
+            pass
+        time.sleep(0.5)
+    raise TimeoutError(f'The server on {host}:{port} did not start in {timeout}s')
+
+
+def main():
+    args = argParse()
+    serverConfig = createServernamePortTopicListDict(readConfig(os.path.join(ROOT, args.server_config)))
+    # Same format as ZmqSubscriber._crafteUUID
+    uuids = [f"{item['ip']}-{item['port']}-{item['topic']}" for item in serverConfig]
+    topicPaths = {f"{values['ip']}-{values['port']}-{values['topic']}": path for path, values in createHumanReadableNames(serverConfig)}
+
+    stopPublishing = threading.Event()
+    if args.publish_rate > 0:
+        topicsByPort = defaultdict(list)
+        for item in serverConfig:
+            topicsByPort[item['port']].append(item['topic'] or 'topic0')
+        for port, topics in topicsByPort.items():
+            threading.Thread(target=publish, args=(port, topics, args.publish_rate, stopPublishing), daemon=True).start()
+
+    server = None
+    pid = args.pid
+    if args.url is None:
+        host, port = 'localhost', args.port
+        server = subprocess.Popen([sys.executable, 'main.py', '--port', str(port), '--server_config', args.server_config,
+                                   '--metrics_db', ''], cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        pid = server.pid
+    else:
+        host, port = args.url.split('://', 1)[-1].rstrip('/').split(':')
+        port = int(port)
+
+    try:
+        dependencies = waitForServer(host, port)
+        pagesCallback, callbacks = classifyCallbacks(dependencies, uuids)
+        connection = http.client.HTTPConnection(host, port, timeout=30)
+        connection.request('GET', '/_dash-layout')
+        appProps = collectProps(json.loads(connection.getresponse().read()), {})
+        connection.close()
+        stop = threading.Event()
+        results = []
+        clients = []
+        for i in range(args.clients):
+            page = args.pages[i % len(args.pages)]
+            if page == 'topic':
+                path = topicPaths[uuids[(i // len(args.pages)) % len(uuids)]]
+            else:
+                path = f'/{page}-view'
+            clients.append(SimulatedClient(host, port, path, pagesCallback, callbacks, appProps, stop, results))
+
+        sampler = ProcessSampler(pid, stop) if pid is not None and os.path.exists(f'/proc/{pid}') else None
+        if sampler is not None:
+            sampler.start()
+        start = time.time()
+        for client in clients:
+            client.start()
+        stop.wait(args.duration)
+        stop.set()
+        duration = time.time() - start
+        for client in clients:
+            client.join(timeout=30)
+
+        report = {
+            'clients': args.clients,
+            'duration_s': duration,
+            'requests_per_s': len(results) / duration,
+            'pages': summarize(results, duration),
+            'server': sampler.summary() if sampler is not None else {},
+        }
+    finally:
+        stopPublishing.set()
+        if server is not None:
+            server.terminate()
+            try:
+                server.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                server.kill()
+
+    print(f"{report['clients']} clients, {report['duration_s']:.1f}s, {report['requests_per_s']:.1f} requests/s")
+    print(f"{'page':<10}{'req/s':>8}{'errors':>8}{'missed':>8}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for page, stats in report['pages'].items():
+        print(f"{page:<10}{stats['requests_per_s']:>8.1f}{stats['errors']:>8}{stats['missed_interval']:>8.1%}"
+              f"{stats['p50_ms']:>9.1f}{stats['p90_ms']:>9.1f}{stats['p99_ms']:>9.1f}{stats['max_ms']:>9.1f}")
+    if report['server']:
+        print(f"server cpu {report['server']['cpu_percent']:.0f}%, rss max {report['server']['rss_mb_max']:.0f}MB")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == '__main__':
+    main()
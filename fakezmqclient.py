@@ -3,10 +3,11 @@ import time
 import threading
 # This script is a fake client that recieves from themessages to the fakezmqclient.py script.
 
-def fakeClient(port, topic, message):
+def fakeClient(port, topic, message, endpoint=None):
     context = zmq.Context()
     socket = context.socket(zmq.SUB)
-    socket.connect("tcp://localhost:{}".format(port))
+    # Connect to the monitor relay instead of the server when an endpoint is given
+    socket.connect(endpoint or "tcp://localhost:{}".format(port))
     socket.setsockopt_string(zmq.SUBSCRIBE, topic)
     while True:
         message = socket.recv_string()
@@ -14,9 +15,13 @@ def fakeClient(port, topic, message):
         time.sleep(1)
 
 def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Fake zmq client')
+    parser.add_argument('--relay', type=str, default=None, help='Subscribe through the monitor relay, e.g. tcp://localhost:6000')
+    args = parser.parse_args()
     # Create a thread for each server
     for i in range(10):
-        t = threading.Thread(target=fakeClient, args=(5555+i, f'topic{i}', f'message{i}'))
+        t = threading.Thread(target=fakeClient, args=(5555+i, f'topic{i}', f'message{i}', args.relay))
         t.start()
     while True:
         time.sleep(1)
@@ -11,8 +11,10 @@ from dash import dcc
 from DashComponents.configUtils import readConfig, validateConfig, createHumanReadableNames, createServernamePortTopicListDict
 from DashComponents.navigationBar import NavigationBars
 from DashComponents.visUtils import dynamicallyCreateVis
+from DashComponents.refreshScheduler import visibilityLayout
 
 from src.zmqUtils import ZmqSubscriber
+from src.diagnostics import Diagnostics
 
 def argParse():
     import argparse
@@ -21,18 +23,35 @@ def argParse():
     parser.add_argument('--port', type=int, default=8050, help='Port to run the server on')
     parser.add_argument('--server_config', type=str, default='configs/monitorConfig.yaml', help='Path to the server configuration file')
     parser.add_argument('--navigation_config', type=str, default='configs/navigationConfig.yaml', help='Path to the navigation configuration file')
+    parser.add_argument('--relay_endpoint', type=str, default=None, help='Re-publish the subscribed servers on this endpoint, e.g. tcp://*:6000')
+    parser.add_argument('--metrics_db', type=str, default='metrics.sqlite', help='SQLite database the metrics history is kept in, empty to disable')
+    parser.add_argument('--recording_dir', type=str, default='recordings', help='Directory the recordings are written to')
+    parser.add_argument('--recording_codec', type=str, default='zlib', choices=['zlib', 'lz4', 'zstd'], help='Compression of the recordings, lz4 and zstd need their packages installed')
+    parser.add_argument('--recording_segment_mb', type=float, default=64, help='Size at which a recording segment is rotated')
+    parser.add_argument('--recording_segment_minutes', type=float, default=60, help='Age at which a recording segment is rotated')
+    parser.add_argument('--recording_budget_mb', type=float, default=None, help='Delete the oldest recording segments past this much disk')
     return parser.parse_args()
 
 if __name__ == '__main__':
     args = argParse()
     config = createServernamePortTopicListDict(readConfig(args.server_config))
     zqmSubscriber = ZmqSubscriber()
+    zqmSubscriber.configureMetricsStore(args.metrics_db)
+    if args.relay_endpoint:
+        zqmSubscriber.enableRelay(args.relay_endpoint)
+    zqmSubscriber.configureRecording(
+        directory=args.recording_dir,
+        codec=args.recording_codec,
+        segmentBytes=int(args.recording_segment_mb * 1024 * 1024),
+        segmentSeconds=args.recording_segment_minutes * 60,
+        retentionBytes=None if args.recording_budget_mb is None else int(args.recording_budget_mb * 1024 * 1024))
     navBar = NavigationBars(readConfig(args.navigation_config))
     app = dash.Dash(__name__, use_pages=True, external_stylesheets=[dbc.themes.MATERIA, dbc.icons.FONT_AWESOME, dbc.themes.BOOTSTRAP])
     app.layout = dbc.Container([
             dcc.Input(id='page-load-trigger', style={'display': 'none'}),
-            dcc.Interval(id='interval-component', interval=200, n_intervals=0),
+            visibilityLayout(),
             dbc.Container([navBar.navbar_layout(), dash.page_container], fluid=True),
         ], fluid=True)
     dynamicallyCreateVis(config, zqmSubscriber)
+    Diagnostics().registerEndpoint(app.server)
     app.run(debug=args.debug, port=args.port)
@@ -0,0 +1,72 @@
+import json
+import dash
+from dash import html, dcc, callback, ctx, Input, Output
+
+from src.diagnostics import Diagnostics
+from DashComponents.refreshScheduler import registerVisibilityPause
+
+dash.register_page(__name__)
+
+diagnostics = Diagnostics()
+
+TIMING_COLUMNS = ['count', 'errors', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms', 'cpu_ms', 'payload_bytes']
+
+def formatValue(value) -> str:
+    if value is None:
+        return '-'
+    if isinstance(value, float):
+        return f'{value:.2f}'
+    return str(value)
+
+def createTable(header: list, rows: list) -> html.Table:
+    return html.Table([
+        html.Tr([html.Th(column) for column in header], style={'background': 'lightgray'}),
+    ] + [
+        html.Tr([html.Td(formatValue(value)) for value in row], style={'borderBottom': '1px solid black'}) for row in rows
+    ], style={'width': '100%', 'border-collapse': 'collapse', 'marginBottom': '20px'})
+
+def createTimingTable(stats: dict) -> html.Table:
+    rows = [[name] + [values[column] for column in TIMING_COLUMNS] for name, values in sorted(stats.items())]
+    return createTable(['name'] + TIMING_COLUMNS, rows)
+
+layout = html.Div([
+    html.H1("Diagnostics"),
+    html.A("JSON", href='/diagnostics.json'),
+    html.Div([
+        html.Button("Start profiler", id='diagnostics-profiler-start'),
+        html.Button("Stop profiler", id='diagnostics-profiler-stop'),
+    ]),
+    # Refreshed slower than the rest of the app so the page does not skew what it measures
+    dcc.Interval(id='diagnostics-interval', interval=2000, n_intervals=0),
+    html.Div(id='diagnostics-content'),
+])
+
+registerVisibilityPause('diagnostics-interval')
+
+@callback(
+    Output('diagnostics-content', 'children'),
+    [Input('diagnostics-interval', 'n_intervals'),
+        Input('diagnostics-profiler-start', 'n_clicks'),
+        Input('diagnostics-profiler-stop', 'n_clicks')])
+@diagnostics.instrumentCallback('updateDiagnostics')
+def updateDiagnostics(n, *args):
+    if ctx.triggered_id == 'diagnostics-profiler-start':
+        diagnostics.setProfilerEnabled(True)
+    elif ctx.triggered_id == 'diagnostics-profiler-stop':
+        diagnostics.setProfilerEnabled(False)
+    snapshot = diagnostics.getSnapshot()
+    profiler = snapshot['profiler']
+    return html.Div([
+        html.H3(f"Uptime {snapshot['uptime_s']:.0f}s, process cpu {snapshot['process_cpu_s']:.1f}s"),
+        html.H2("Callbacks"),
+        createTimingTable(snapshot['callbacks']),
+        html.H2("Loops"),
+        createTimingTable(snapshot['loops']),
+        html.H2("Queues"),
+        createTable(['name', 'value'], [[name, json.dumps(value)] for name, value in sorted(snapshot['gauges'].items())]),
+        html.H2("Threads"),
+        createTable(['name', 'user_s', 'system_s'], [[thread['name'], thread['user_s'], thread['system_s']] for thread in snapshot['threads']]),
+        html.H2(f"Profiler ({'running' if profiler['enabled'] else 'stopped'}, {profiler['samples']} samples)"),
+        createTable(['frame', 'samples'], [[leaf['frame'], leaf['samples']] for leaf in profiler['leaves']]),
+        createTable(['stack', 'samples'], [[stack['stack'], stack['samples']] for stack in profiler['stacks']]),
+    ])
@@ -6,6 +6,8 @@ from typing import List, Dict
 from DashComponents.graph import ZMQGraph
 from DashComponents.configUtils import readConfig
 from src.zmqUtils import ZmqSubscriber
+from src.diagnostics import Diagnostics
+from DashComponents.refreshScheduler import RefreshScheduler
 
 dash.register_page(__name__)
 
@@ -16,9 +18,11 @@ zmqSub = ZmqSubscriber()
 config = readConfig('configs/graphConfig.yaml')
 graphIds: Dict[str, ZMQGraph] = {}
 graphs: List[html.Div] = []
+# The metrics are recalculated every second, the graphs back off while the rates they show do not change
+refreshScheduler = RefreshScheduler('graph-interval-component', 1000)
 for graph in config['graphs']:
     id = graph['id']
-    g = ZMQGraph(zmqSub, graph['historyPoints'], graph.get('filter_ids', None))
+    g = ZMQGraph(zmqSub, graph['historyPoints'], graph.get('filter_ids', None), graph.get('backfillSeconds', None))
 
     graphLayout = html.Div([
         html.H1(graph['title']),
@@ -31,8 +35,9 @@ for graph in config['graphs']:
 
     @callback(
         Output(id, 'figure'),
-        [Input('interval-component', 'n_intervals'),
+        [refreshScheduler.getTriggerInput(),
             g.getPageLoadTrigger()])
+    @Diagnostics().instrumentCallback(f'updateGraph[{id}]')
     def updateGraph(n, *args):
         id = dash.callback_context.outputs_list['id']
         return graphIds[id].update_graph(n, *args)
@@ -42,4 +47,17 @@ for graph in config['graphs']:
 layout = html.Div([
     html.H1('Graph View'),
     html.Div(graphs),
-])
\ No newline at end of file
+    *refreshScheduler.layout(),
+])
+
+def getGraphedRates() -> List:
+    '''
+        Returns the rates of the graphed uuids, they only change when messages arrive or stop arriving.
+    '''
+    filterIds = [graph.filterIds for graph in graphIds.values()]
+    metrics = dict(zmqSub.getMetrics())
+    return [[uuid, metric['message_rate'], metric['payload_rate']] for uuid, metric in sorted(metrics.items())
+            if any(ids is None or uuid in ids for ids in filterIds)]
+
+refreshScheduler.registerVisibilityPause()
+refreshScheduler.registerTriggerCallback(getGraphedRates)
\ No newline at end of file
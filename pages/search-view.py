@@ -0,0 +1,119 @@
+import re
+import time
+import dash
+from dash import html, dcc, callback, clientside_callback, ctx, Input, Output, State, Patch
+
+from src.zmqUtils import ZmqSubscriber
+from src.messageSearch import MessageSearcher
+from src.diagnostics import Diagnostics
+from DashComponents.refreshScheduler import VISIBILITY_INTERVAL_ID
+
+dash.register_page(__name__)
+
+# ZMQ Subscriber is a singleton
+zmqSub = ZmqSubscriber()
+searcher = MessageSearcher(zmqSub)
+Diagnostics().registerGauge('search_queue', searcher.getQueueDepth)
+
+def resultRow(match: dict) -> html.Tr:
+    message = match['message']
+    timeReceived = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(match['time']))
+    return html.Tr([
+        html.Td(timeReceived),
+        html.Td(match['uuid']),
+        html.Td(match['source']),
+        html.Td([message[:match['start']], html.Mark(message[match['start']:match['end']]), message[match['end']:]]),
+    ], style={'borderBottom': '1px solid black'})
+
+def layout():
+    # The layout is a function so the topic list is read when the page is opened
+    return html.Div([
+        html.H1("Message Search"),
+        dcc.Textarea(id='search-patterns', placeholder='One pattern per line, e.g. order_id=123', style={'width': '100%'}),
+        dcc.Dropdown(id='search-topics', options=zmqSub.getUUIDs(), multi=True, placeholder='All topics'),
+        dcc.Checklist(id='search-options', options=[
+                {'label': 'Regex', 'value': 'regex'},
+                {'label': 'Ignore case', 'value': 'ignorecase'},
+                {'label': 'Include recordings', 'value': 'recordings'},
+            ], value=[], inline=True),
+        html.Div([
+            html.Span("Time budget (s) "),
+            dcc.Input(id='search-time-budget', type='number', value=5, min=0.1),
+        ]),
+        html.Button("Search", id='search-button'),
+        html.Button("Cancel", id='search-cancel-button'),
+        html.Div(id='search-status'),
+        dcc.Store(id='search-job'),
+        dcc.Interval(id='search-poll-interval', interval=250, n_intervals=0, disabled=True),
+        html.Table([
+            html.Thead(html.Tr([html.Th("Time"), html.Th("Topic"), html.Th("Source"), html.Th("Message")])),
+            html.Tbody(id='search-results-body'),
+        ], style={'width': '100%', 'border-collapse': 'collapse', 'marginTop': '20px'}),
+    ])
+
+@callback(
+    [Output('search-job', 'data'),
+        Output('search-results-body', 'children'),
+        Output('search-poll-interval', 'disabled'),
+        Output('search-status', 'children')],
+    [Input('search-button', 'n_clicks'),
+        Input('search-cancel-button', 'n_clicks'),
+        Input('search-poll-interval', 'n_intervals')],
+    [State('search-patterns', 'value'),
+        State('search-topics', 'value'),
+        State('search-options', 'value'),
+        State('search-time-budget', 'value'),
+        State('search-job', 'data')],
+    prevent_initial_call=True)
+@Diagnostics().instrumentCallback('searchMessages')
+def searchMessages(searchClicks, cancelClicks, n, patterns, uuids, options, timeBudget, job):
+    '''
+        Starts, cancels and polls the searches. Only the new matches are sent to the browser on every poll.
+    '''
+    if ctx.triggered_id == 'search-button':
+        patterns = [pattern for pattern in (patterns or '').splitlines() if pattern]
+        if len(patterns) == 0:
+            return dash.no_update, [], True, 'Enter at least one pattern'
+        options = options or []
+        try:
+            jobId = searcher.startSearch(patterns, uuids, useRegex='regex' in options, ignoreCase='ignorecase' in options,
+                                         includeRecordings='recordings' in options, timeBudget=timeBudget or 5)
+        except re.error as e:
+            return dash.no_update, [], True, f'Invalid pattern: {e}'
+        return {'jobId': jobId, 'offset': 0, 'done': False}, [], False, 'Searching...'
+    if job is None:
+        return dash.no_update, dash.no_update, True, dash.no_update
+    if ctx.triggered_id == 'search-cancel-button':
+        searcher.cancelSearch(job['jobId'])
+    results = searcher.getResults(job['jobId'], job['offset'])
+    if results['done']:
+        # The sources are scanned in parallel, once they are all done the rows are sent again sorted newest first
+        matches = searcher.getResults(job['jobId'])['matches']
+        rows = [resultRow(match) for match in sorted(matches, key=lambda match: match['time'], reverse=True)]
+    else:
+        rows = Patch()
+        rows.extend([resultRow(match) for match in results['matches']])
+    status = f"{results['status'].capitalize()}: {results['offset']} matches in {results['scanned']} messages"
+    if results['status'] == 'truncated':
+        status += ', only the newest matches are shown'
+    return {'jobId': job['jobId'], 'offset': results['offset'], 'done': results['done']}, rows, results['done'], status
+
+# Pauses the poll while the tab is hidden and resumes it if the search is still running when the tab is shown again.
+# The search keeps running on the server, the matches found in the meantime are sent on the next poll.
+clientside_callback(
+    '''
+    function(n, disabled, job) {
+        if (document.hidden) {
+            return disabled ? window.dash_clientside.no_update : true;
+        }
+        if (disabled && job && !job.done) {
+            return false;
+        }
+        return window.dash_clientside.no_update;
+    }
+    ''',
+    Output('search-poll-interval', 'disabled', allow_duplicate=True),
+    Input(VISIBILITY_INTERVAL_ID, 'n_intervals'),
+    State('search-poll-interval', 'disabled'),
+    State('search-job', 'data'),
+    prevent_initial_call=True)
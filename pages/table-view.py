@@ -6,6 +6,8 @@ from typing import List
 from DashComponents.serverTable import ServerTable
 from DashComponents.configUtils import readConfig
 from src.zmqUtils import ZmqSubscriber
+from src.diagnostics import Diagnostics
+from DashComponents.refreshScheduler import RefreshScheduler
 from DashComponents.configUtils import createHumanReadableNames, createServernamePortTopicListDict
 
 dash.register_page(__name__)
@@ -19,16 +21,26 @@ processedConfig = createServernamePortTopicListDict(config)
 server_table = ServerTable(processedConfig, zmqSub)
 humanReadableNames = createHumanReadableNames(processedConfig)
 serverTableLayout = server_table.server_table_layout(humanReadableNames)
+# The statuses are at most as fresh as the metrics, the table backs off while none of them changes
+refreshScheduler = RefreshScheduler('table-interval-component', 1000)
 
 layout = html.Div([
     html.H1("Server List"),
-    serverTableLayout
+    serverTableLayout,
+    *refreshScheduler.layout(),
 ])
 
+def getStatuses() -> List[str]:
+    return [zmqSub.getStatus(id) for id, _ in server_table.getImageOuputList()]
+
+refreshScheduler.registerVisibilityPause()
+refreshScheduler.registerTriggerCallback(getStatuses)
+
 @callback(
     [Output(output[0], output[1]) for output in server_table.getImageOuputList()],
-    [Input('interval-component', 'n_intervals'), server_table.getPageLoadTrigger()],
+    [refreshScheduler.getTriggerInput(), server_table.getPageLoadTrigger()],
     [State(state[0], state[1]) for state in server_table.getImageStateList()])
+@Diagnostics().instrumentCallback('connectSevers')
 def connectSevers(x, *args):
     #Dirty hack removing none from args
     args = [arg for arg in args if arg is not None]
@@ -0,0 +1,281 @@
+import os
+import sys
+import json
+import time
+import bisect
+import functools
+import threading
+from collections import Counter
+from typing import Callable, Dict, List
+
+import plotly.utils
+
+# Upper bounds of the latency histogram buckets in seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, float('inf'))
+
+
+class TimingStats(object):
+    '''
+        Call count, latency histogram, cpu time and payload size of a callback or of a loop.
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.count = 0
+        self.errors = 0
+        self.totalLatency = 0.0
+        self.maxLatency = 0.0
+        self.totalCpu = 0.0
+        self.histogram = [0] * len(LATENCY_BUCKETS)
+        self.payloadSamples = 0
+        self.payloadBytes = 0
+
+    def record(self, latency: float, cpu: float, payloadBytes: int | None = None, error: bool = False) -> None:
+        bucket = bisect.bisect_left(LATENCY_BUCKETS, latency)
+        with self.lock:
+            self.count += 1
+            self.errors += error
+            self.totalLatency += latency
+            self.maxLatency = max(self.maxLatency, latency)
+            self.totalCpu += cpu
+            self.histogram[bucket] += 1
+            if payloadBytes is not None:
+                self.payloadSamples += 1
+                self.payloadBytes += payloadBytes
+
+    def percentile(self, fraction: float) -> float:
+        '''
+            Returns the upper bound of the histogram bucket the percentile falls in.
+        '''
+        target = self.count * fraction
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.histogram):
+            cumulative += count
+            if cumulative >= target and count:
+                return bound if bound != float('inf') else self.maxLatency
+        return 0.0
+
+    def toDict(self) -> Dict[str, any]:
+        with self.lock:
+            count = max(self.count, 1)
+            return {
+                'count': self.count,
+                'errors': self.errors,
+                'mean_ms': self.totalLatency / count * 1000,
+                'p50_ms': self.percentile(0.5) * 1000,
+                'p95_ms': self.percentile(0.95) * 1000,
+                'p99_ms': self.percentile(0.99) * 1000,
+                'max_ms': self.maxLatency * 1000,
+                'cpu_ms': self.totalCpu / count * 1000,
+                'payload_bytes': self.payloadBytes / self.payloadSamples if self.payloadSamples else None,
+                'histogram': dict(zip([str(bound) for bound in LATENCY_BUCKETS], self.histogram)),
+            }
+
+
+class SamplingProfiler(object):
+    '''
+        Samples the stacks of all the threads at a fixed interval while it is enabled.
+
+        The stacks are kept in collapsed form (outermost;...;innermost) so they can be fed to a flame graph.
+    '''
+    maxDepth = 64
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.enabled = False
+        self.samples = 0
+        self.stacks = Counter()
+        self.leaves = Counter()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def start(self) -> None:
+        if self.enabled:
+            return
+        with self.lock:
+            self.samples = 0
+            self.stacks = Counter()
+            self.leaves = Counter()
+        self.enabled = True
+        self.thread = threading.Thread(target=self.__run, name='sampling-profiler', daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.enabled = False
+
+    def __run(self):
+        '''
+            This function is meant to be run in a thread and is not meant to be called directly.
+        '''
+        ownId = threading.get_ident()
+        names = {}
+        while self.enabled:
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            with self.lock:
+                for threadId, frame in sys._current_frames().items():
+                    if threadId == ownId:
+                        continue
+                    stack = []
+                    while frame is not None and len(stack) < self.maxDepth:
+                        code = frame.f_code
+                        stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}')
+                        frame = frame.f_back
+                    if not stack:
+                        continue
+                    self.leaves[stack[0]] += 1
+                    self.stacks[';'.join([names.get(threadId, str(threadId))] + stack[::-1])] += 1
+                self.samples += 1
+            time.sleep(self.interval)
+
+    def toDict(self, top: int = 25) -> Dict[str, any]:
+        with self.lock:
+            return {
+                'enabled': self.enabled,
+                'samples': self.samples,
+                'interval_ms': self.interval * 1000,
+                'leaves': [{'frame': frame, 'samples': count} for frame, count in self.leaves.most_common(top)],
+                'stacks': [{'stack': stack, 'samples': count} for stack, count in self.stacks.most_common(top)],
+            }
+
+
+def getThreadCpuTimes() -> List[Dict[str, any]]:
+    '''
+        Returns the cpu time used by every thread of the process. Only implemented on linux, returns an empty list
+        elsewhere.
+    '''
+    ticks = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+    threads = []
+    for thread in threading.enumerate():
+        try:
+            with open(f'/proc/self/task/{thread.native_id}/stat', 'r') as f:
+                # The thread name is in parentheses and can hold spaces, the fields after it are space separated
+                fields = f.read().rsplit(')', 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        threads.append({
+            'name': thread.name,
+            'user_s': int(fields[11]) / ticks,
+            'system_s': int(fields[12]) / ticks,
+        })
+    return sorted(threads, key=lambda thread: -(thread['user_s'] + thread['system_s']))
+
+
+class Diagnostics(object):
+    '''
+        Collects timings of the dash callbacks and of the subscriber loops, queue depths and thread cpu times.
+
+        This class is a singleton.
+    '''
+    # The payload size of a callback is measured by serializing its result, only do it on every nth call
+    payloadSampleEvery = 10
+
+    def __init__(self):
+        if getattr(self, '_initialized', False):
+            return
+        self._initialized = True
+        self.callbackStats: Dict[str, TimingStats] = {}
+        self.loopStats: Dict[str, TimingStats] = {}
+        self.gauges: Dict[str, Callable[[], any]] = {}
+        self.profiler = SamplingProfiler()
+        self.startTime = time.time()
+        self.lock = threading.Lock()
+
+    def __new__(cls):
+        '''
+            This function implements the singleton pattern.
+        '''
+        if not hasattr(cls, 'instance'):
+            cls.instance = super(Diagnostics, cls).__new__(cls)
+        return cls.instance
+
+    def _getStats(self, stats: Dict[str, TimingStats], name: str) -> TimingStats:
+        if name not in stats:
+            with self.lock:
+                stats.setdefault(name, TimingStats())
+        return stats[name]
+
+    def instrumentCallback(self, name: str) -> Callable:
+        '''
+            Decorator timing a dash callback. Place it under @callback so dash registers the timed function.
+        '''
+        def decorator(func):
+            stats = self._getStats(self.callbackStats, name)
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                startCpu = time.thread_time()
+                error = True
+                result = None
+                try:
+                    result = func(*args, **kwargs)
+                    error = False
+                    return result
+                finally:
+                    latency = time.perf_counter() - start
+                    cpu = time.thread_time() - startCpu
+                    payloadBytes = None
+                    if not error and stats.count % self.payloadSampleEvery == 0:
+                        payloadBytes = self._measurePayload(result)
+                    stats.record(latency, cpu, payloadBytes, error)
+            return wrapper
+        return decorator
+
+    def _measurePayload(self, result) -> int | None:
+        try:
+            return len(json.dumps(result, cls=plotly.utils.PlotlyJSONEncoder))
+        except (TypeError, ValueError):
+            return None
+
+    def recordLoop(self, name: str, latency: float, cpu: float) -> None:
+        '''
+            Records one iteration of a loop, e.g. handling one message in a subscriber thread.
+        '''
+        self._getStats(self.loopStats, name).record(latency, cpu)
+
+    def registerGauge(self, name: str, gauge: Callable[[], any]) -> None:
+        '''
+            Registers a function returning a value to report, e.g. a queue depth.
+        '''
+        self.gauges[name] = gauge
+
+    def getGauges(self) -> Dict[str, any]:
+        values = {}
+        for name, gauge in list(self.gauges.items()):
+            try:
+                values[name] = gauge()
+            except Exception as e:
+                values[name] = f'ERROR: {e}'
+        return values
+
+    def getSnapshot(self) -> Dict[str, any]:
+        return {
+            'uptime_s': time.time() - self.startTime,
+            'process_cpu_s': time.process_time(),
+            'callbacks': {name: stats.toDict() for name, stats in list(self.callbackStats.items())},
+            'loops': {name: stats.toDict() for name, stats in list(self.loopStats.items())},
+            'gauges': self.getGauges(),
+            'threads': getThreadCpuTimes(),
+            'profiler': self.profiler.toDict(),
+        }
+
+    def setProfilerEnabled(self, enabled: bool) -> None:
+        if enabled:
+            self.profiler.start()
+        else:
+            self.profiler.stop()
+
+    def registerEndpoint(self, server) -> None:
+        '''
+            Adds the /diagnostics.json endpoint to the flask server. POST {"profiler": true|false} to toggle the
+            sampling profiler.
+        '''
+        from flask import request, jsonify
+
+        @server.route('/diagnostics.json', methods=['GET', 'POST'])
+        def diagnosticsJson():
+            if request.method == 'POST':
+                body = request.get_json(silent=True) or {}
+                if 'profiler' in body:
+                    self.setProfilerEnabled(bool(body['profiler']))
+            return jsonify(self.getSnapshot())
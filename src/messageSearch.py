@@ -0,0 +1,228 @@
+import re
+import time
+import threading
+import itertools
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Tuple, Iterable
+
+from src.zmqUtils import ZmqSubscriber
+
+
+class MessageMatcher(object):
+    '''
+        Matches a message against several patterns at once.
+
+        The patterns are compiled into a single alternation so every message is only scanned once, no matter how many
+        patterns are searched for. A leading inline flag like (?i) is scoped to its own alternative. The regexes that
+        can not be combined without changing their meaning, those with groups (their numbers and backreferences would
+        shift) or in verbose mode, are searched on their own.
+    '''
+    # Global inline flags, only allowed at the start of a pattern
+    inlineFlags = re.compile(r'\(\?([aiLmsux]+)\)')
+
+    def __init__(self, patterns: List[str], useRegex: bool = False, ignoreCase: bool = False):
+        if len(patterns) == 0:
+            raise ValueError('At least one pattern is required')
+        self.patterns = patterns
+        flags = re.IGNORECASE if ignoreCase else 0
+        alternatives = []
+        # (pattern index, compiled regex) of the patterns searched on their own
+        self.separate: List[Tuple[int, re.Pattern]] = []
+        for i, pattern in enumerate(patterns):
+            alternative = self._toAlternative(pattern, flags) if useRegex else re.escape(pattern)
+            if alternative is None:
+                self.separate.append((i, re.compile(pattern, flags)))
+            else:
+                # Named groups let us know which of the patterns matched
+                alternatives.append(f'(?P<p{i}>{alternative})')
+        self.regex = re.compile('|'.join(alternatives), flags) if alternatives else None
+
+    def _toAlternative(self, pattern: str, flags: int) -> str | None:
+        '''
+            Returns the pattern rewritten to be a part of the alternation, or None if it has to be searched on its own.
+            Raises a re.error if the pattern does not compile.
+        '''
+        if re.compile(pattern, flags).groups > 0:
+            return None
+        letters = ''
+        rest = pattern
+        while (match := self.inlineFlags.match(rest)) is not None:
+            letters += match.group(1)
+            rest = rest[match.end():]
+        # A comment in verbose mode would swallow the closing parenthesis of the group
+        if 'x' in letters or re.compile(rest, flags).flags != re.compile('', flags).flags:
+            return None
+        return f'(?{letters}:{rest})' if letters else rest
+
+    def search(self, message: str) -> Tuple[str, int, int] | None:
+        '''
+            Returns the pattern that matched first and the span of the match, or None if nothing matched.
+
+            Like in an alternation, the leftmost match wins and the pattern listed first wins at the same position.
+        '''
+        best = None
+        if self.regex is not None:
+            match = self.regex.search(message)
+            if match is not None:
+                best = (match.start(), int(match.lastgroup[1:]), match.end())
+        for i, regex in self.separate:
+            match = regex.search(message)
+            if match is not None and (best is None or (match.start(), i) < best[:2]):
+                best = (match.start(), i, match.end())
+        if best is None:
+            return None
+        start, i, end = best
+        return self.patterns[i], start, end
+
+
+class SearchJob(object):
+    '''
+        Holds the state of a single search. Matches are appended by the worker threads and read incrementally
+        by the callers with an offset.
+    '''
+    def __init__(self, jobId: str, matcher: MessageMatcher, uuids: List[str], timeBudget: float, maxMatches: int):
+        self.jobId = jobId
+        self.matcher = matcher
+        self.uuids = uuids
+        self.deadline = time.time() + timeBudget
+        self.maxMatches = maxMatches
+        self.matches = []
+        self.scanned = 0
+        self.status = 'running'
+        self.futures = []
+        self.cancelEvent = threading.Event()
+        self.lock = threading.Lock()
+
+    def shouldStop(self) -> bool:
+        if self.cancelEvent.is_set():
+            return True
+        if time.time() > self.deadline:
+            self.status = 'timeout'
+            self.cancelEvent.set()
+            return True
+        return False
+
+    def addMatch(self, match: Dict) -> None:
+        with self.lock:
+            if len(self.matches) >= self.maxMatches:
+                # The scans run newest first, the matches that did not fit are the older ones
+                if self.status == 'running':
+                    self.status = 'truncated'
+                self.cancelEvent.set()
+                return
+            self.matches.append(match)
+
+    def isDone(self) -> bool:
+        return all(future.done() for future in self.futures)
+
+
+class MessageSearcher(object):
+    '''
+        Searches the recent message history and the recordings of the zmq subscriber.
+
+        The scanning is done in a thread pool, one task per uuid and source, so neither the subscriber threads nor the
+        dash request threads wait on a search. Results are streamed back with getResults.
+    '''
+    # Yield the GIL after this many messages so the subscriber threads keep up while a search runs
+    yieldEvery = 256
+    # Number of finished searches kept around for late readers
+    maxFinishedJobs = 16
+
+    def __init__(self, zqmSubscriber: ZmqSubscriber, maxWorkers: int = 2):
+        self.zqmSubscriber = zqmSubscriber
+        self.executor = ThreadPoolExecutor(max_workers=maxWorkers, thread_name_prefix='message-search')
+        self.jobs = OrderedDict()
+        self.jobCounter = itertools.count()
+        self.lock = threading.Lock()
+
+    def startSearch(self, patterns: List[str], uuids: List[str] | None = None, useRegex: bool = False,
+                    ignoreCase: bool = False, includeRecordings: bool = False, timeBudget: float = 5,
+                    maxMatches: int = 500) -> str:
+        '''
+            Starts a search and returns its id. Raises a re.error if a regex pattern does not compile.
+        '''
+        matcher = MessageMatcher(patterns, useRegex, ignoreCase)
+        if not uuids:
+            uuids = self.zqmSubscriber.getUUIDs()
+        job = SearchJob(f'search-{next(self.jobCounter)}', matcher, uuids, timeBudget, maxMatches)
+        with self.lock:
+            self._evictFinishedJobs()
+            self.jobs[job.jobId] = job
+        for uuid in uuids:
+            job.futures.append(self.executor.submit(self._searchHistory, job, uuid))
+            if includeRecordings:
+                job.futures.append(self.executor.submit(self._searchRecording, job, uuid))
+        return job.jobId
+
+    def cancelSearch(self, jobId: str) -> None:
+        job = self.jobs.get(jobId, None)
+        if job is None:
+            return
+        if job.status == 'running':
+            job.status = 'cancelled'
+        job.cancelEvent.set()
+        for future in job.futures:
+            future.cancel()
+
+    def getResults(self, jobId: str, offset: int = 0) -> Dict[str, any]:
+        '''
+            Returns the matches found since the offset, the offset to use on the next call and the search status.
+        '''
+        job = self.jobs.get(jobId, None)
+        if job is None:
+            return {'matches': [], 'offset': offset, 'status': 'unknown', 'done': True, 'scanned': 0}
+        done = job.isDone()
+        if done and job.status == 'running':
+            job.status = 'done'
+        with job.lock:
+            matches = job.matches[offset:]
+        return {
+            'matches': matches,
+            'offset': offset + len(matches),
+            'status': job.status,
+            'done': done,
+            'scanned': job.scanned,
+        }
+
+    def getQueueDepth(self) -> int:
+        '''
+            Returns the number of scans waiting for a worker.
+        '''
+        return sum(1 for job in list(self.jobs.values()) for future in job.futures if not future.running() and not future.done())
+
+    def _evictFinishedJobs(self) -> None:
+        finished = [jobId for jobId, job in self.jobs.items() if job.isDone()]
+        for jobId in finished[:max(0, len(finished) - self.maxFinishedJobs)]:
+            del self.jobs[jobId]
+
+    def _scan(self, job: SearchJob, uuid: str, source: str, records: Iterable[Tuple[float, str]]) -> None:
+        for count, (timestamp, message) in enumerate(records):
+            if count % self.yieldEvery == 0:
+                if job.shouldStop():
+                    return
+                time.sleep(0)
+            job.scanned += 1
+            found = job.matcher.search(message)
+            if found is None:
+                continue
+            pattern, start, end = found
+            job.addMatch({'uuid': uuid, 'source': source, 'time': timestamp, 'pattern': pattern,
+                          'start': start, 'end': end, 'message': message})
+
+    def _searchHistory(self, job: SearchJob, uuid: str) -> None:
+        '''
+            Scans the in memory history of a uuid, newest message first.
+        '''
+        history = self.zqmSubscriber.getMessageHistory(uuid)
+        records = ((data['time'], str(data['message'])) for data in reversed(history))
+        self._scan(job, uuid, 'history', records)
+
+    def _searchRecording(self, job: SearchJob, uuid: str) -> None:
+        '''
+            Scans the recorded segments of a uuid, newest message first, so the latest matches are found within the
+            time budget and the match limit.
+        '''
+        reader = self.zqmSubscriber.getRecordingReader(uuid)
+        records = ((timestamp, message.decode(errors='replace')) for timestamp, message in reader.iterRecords(reverse=True))
+        self._scan(job, uuid, 'recording', records)
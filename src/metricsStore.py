@@ -0,0 +1,156 @@
+import time
+import sqlite3
+import threading
+from typing import List, Dict, Tuple
+
+
+class MetricsStore(object):
+    '''
+        Persists the per uuid throughput metrics to a SQLite database so they survive restarts.
+
+        The samples are kept in one table per resolution. The raw samples are rolled up into the coarser tables and
+        every table has its own retention:
+
+            metrics_1      one sample per second, kept for a day
+            metrics_60     one minute averages, kept for 30 days
+            metrics_3600   one hour averages, kept for a year
+
+        add is called from the metrics thread and only buffers the sample. The buffer is written in a single
+        transaction every flushSeconds. The writes, roll ups and deletes all happen on the thread calling flush,
+        readers use their own connection which WAL mode lets run concurrently with the writer.
+    '''
+    # (resolution, retention) in seconds, the first tier holds the raw samples
+    tiers: Tuple[Tuple[int, int], ...] = ((1, 24 * 3600), (60, 30 * 24 * 3600), (3600, 365 * 24 * 3600))
+
+    def __init__(self, path: str, flushSeconds: float = 10, maintainSeconds: float = 300):
+        self.path = path
+        self.flushSeconds = flushSeconds
+        self.maintainSeconds = maintainSeconds
+        self.pending = []
+        self.lastFlush = time.time()
+        self.lastMaintain = 0
+        self.writer = None
+        self.lock = threading.Lock()
+        with self._connect() as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            for resolution, _ in self.tiers:
+                connection.execute(f'CREATE TABLE IF NOT EXISTS metrics_{resolution} '
+                                   '(uuid TEXT NOT NULL, time REAL NOT NULL, message_rate REAL, payload_rate REAL)')
+                connection.execute(f'CREATE INDEX IF NOT EXISTS metrics_{resolution}_uuid_time ON metrics_{resolution} (uuid, time)')
+            # How far every roll up table has been filled
+            connection.execute('CREATE TABLE IF NOT EXISTS rollups (resolution INTEGER PRIMARY KEY, rolled_until REAL NOT NULL)')
+        connection.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, timeout=10)
+        # WAL only needs a full sync on checkpoints
+        connection.execute('PRAGMA synchronous=NORMAL')
+        return connection
+
+    def add(self, uuid: str, timestamp: float, messageRate: float, payloadRate: float) -> None:
+        with self.lock:
+            self.pending.append((uuid, timestamp, messageRate, payloadRate))
+
+    def flushIfDue(self) -> None:
+        now = time.time()
+        if now - self.lastFlush >= self.flushSeconds:
+            self.flush()
+        if now - self.lastMaintain >= self.maintainSeconds:
+            self.maintain()
+
+    def flush(self) -> None:
+        '''
+            Writes the buffered samples in one transaction.
+        '''
+        with self.lock:
+            pending, self.pending = self.pending, []
+        self.lastFlush = time.time()
+        if not pending:
+            return
+        if self.writer is None:
+            self.writer = self._connect()
+        try:
+            with self.writer:
+                self.writer.executemany(f'INSERT INTO metrics_{self.tiers[0][0]} VALUES (?, ?, ?, ?)', pending)
+        except sqlite3.Error as e:
+            print(f"ERROR: Failed to write {len(pending)} metrics samples: {e}")
+
+    def maintain(self) -> None:
+        '''
+            Rolls the complete buckets up into the coarser tables and deletes the samples past their retention.
+        '''
+        # The samples still in the buffer would be missed by the roll up
+        self.flush()
+        self.lastMaintain = time.time()
+        if self.writer is None:
+            self.writer = self._connect()
+        try:
+            with self.writer:
+                for (source, _), (resolution, _) in zip(self.tiers, self.tiers[1:]):
+                    row = self.writer.execute('SELECT rolled_until FROM rollups WHERE resolution = ?', (resolution,)).fetchone()
+                    rolledUntil = row[0] if row else 0
+                    # Only roll up the buckets that can not receive samples anymore
+                    until = int(self.lastMaintain // resolution) * resolution
+                    if until <= rolledUntil:
+                        continue
+                    self.writer.execute(
+                        f'INSERT INTO metrics_{resolution} '
+                        f'SELECT uuid, CAST(time / {resolution} AS INTEGER) * {resolution} AS bucket, avg(message_rate), avg(payload_rate) '
+                        f'FROM metrics_{source} WHERE time >= ? AND time < ? GROUP BY uuid, bucket',
+                        (rolledUntil, until))
+                    self.writer.execute('INSERT OR REPLACE INTO rollups VALUES (?, ?)', (resolution, until))
+                for resolution, retention in self.tiers:
+                    self.writer.execute(f'DELETE FROM metrics_{resolution} WHERE time < ?', (self.lastMaintain - retention,))
+        except sqlite3.Error as e:
+            print(f"ERROR: Failed to roll up the metrics: {e}")
+
+    def query(self, uuids: List[str], startTime: float, endTime: float | None = None,
+              maxPoints: int | None = None) -> Dict[str, List[Tuple[float, float, float]]]:
+        '''
+            Returns the (time, message rate, payload rate) samples of every uuid in the time range, oldest first.
+
+            The finest table that still holds the start of the range is read up to where it was rolled up to, the rest
+            of the range comes from the finer tables. The samples are averaged into wider buckets when there are more
+            than maxPoints in the range.
+        '''
+        if endTime is None:
+            endTime = time.time()
+        now = time.time()
+        # The samples are only deleted on maintain, so a range starting right at the retention is still covered
+        tier = len(self.tiers) - 1
+        for i, (resolution, retention) in enumerate(self.tiers):
+            if startTime >= now - retention - self.maintainSeconds:
+                tier = i
+                break
+        step = self.tiers[tier][0]
+        if maxPoints is not None and maxPoints > 0:
+            step = max(step, (endTime - startTime) / maxPoints)
+        history = {uuid: [] for uuid in uuids}
+        connection = self._connect()
+        try:
+            rolledUntil = dict(connection.execute('SELECT resolution, rolled_until FROM rollups').fetchall())
+            # (table, start, end) from the coarsest, a table only holds the samples before its roll up point
+            ranges = []
+            cursor = startTime
+            for resolution, _ in reversed(self.tiers[1:tier + 1]):
+                until = min(rolledUntil.get(resolution, 0), endTime)
+                if cursor < until:
+                    ranges.append((resolution, cursor, until))
+                    cursor = until
+            ranges.append((self.tiers[0][0], cursor, endTime))
+            for table, rangeStart, rangeEnd in ranges:
+                # The last range includes its end, the others stop where the next one starts
+                endCondition = 'time <= ?' if rangeEnd == endTime else 'time < ?'
+                if step > table:
+                    sql = (f'SELECT CAST(time / {step} AS INTEGER) * {step} AS bucket, avg(message_rate), avg(payload_rate) '
+                           f'FROM metrics_{table} WHERE uuid = ? AND time >= ? AND {endCondition} GROUP BY bucket ORDER BY bucket')
+                else:
+                    sql = (f'SELECT time, message_rate, payload_rate FROM metrics_{table} '
+                           f'WHERE uuid = ? AND time >= ? AND {endCondition} ORDER BY time')
+                for uuid in uuids:
+                    history[uuid].extend(connection.execute(sql, (uuid, rangeStart, rangeEnd)).fetchall())
+        except sqlite3.Error as e:
+            print(f"ERROR: Failed to read the metrics history: {e}")
+        finally:
+            connection.close()
+        return history
@@ -0,0 +1,422 @@
+'''
+    Recording of zmq messages to disk.
+
+    Every recorded message is a big endian (timestamp, payload length) header followed by the payload. The records of
+    a uuid are written to a directory of rotating segment files. A segment is a sequence of independently compressed
+    blocks with a json lines index next to it, so a reader only decompresses the blocks it needs:
+
+        <directory>/<uuid>/<start time in us>.seg   compressed blocks, one after the other
+        <directory>/<uuid>/<start time in us>.idx   one json line per block, see SegmentedRecorder._writeBlock
+
+    The compression, the file writes and the retention all happen on the BackgroundCompressor thread, the subscriber
+    threads only append records to an in memory block.
+'''
+import os
+import json
+import zlib
+import time
+import queue
+import struct
+import threading
+from typing import Iterator, Tuple, ByteString, Dict, List, Callable
+
+RECORD_HEADER = struct.Struct('!dI')
+
+# Name -> (compress, decompress). zlib is always available, lz4 and zstd are used when they are installed.
+CODECS: Dict[str, Tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]] = {
+    'zlib': (lambda data: zlib.compress(data, 6), zlib.decompress),
+}
+try:
+    import lz4.frame
+    CODECS['lz4'] = (lz4.frame.compress, lz4.frame.decompress)
+except ImportError:
+    pass
+try:
+    import zstandard
+    CODECS['zstd'] = (lambda data: zstandard.ZstdCompressor(level=3).compress(data),
+                      lambda data: zstandard.ZstdDecompressor().decompress(data))
+except ImportError:
+    pass
+
+SEGMENT_SUFFIX = '.seg'
+INDEX_SUFFIX = '.idx'
+
+
+def packRecord(timestamp: float, message: ByteString) -> bytes:
+    '''
+        Packs a single message into the recording format.
+    '''
+    return RECORD_HEADER.pack(timestamp, len(message)) + message
+
+
+def iterRecords(data: ByteString) -> Iterator[Tuple[float, bytes]]:
+    '''
+        Yields the (timestamp, message) records of a buffer of packed records.
+
+        A record that was only partially written (e.g. the process died while recording) is ignored.
+    '''
+    view = memoryview(data)
+    offset = 0
+    while offset + RECORD_HEADER.size <= len(view):
+        timestamp, length = RECORD_HEADER.unpack_from(view, offset)
+        offset += RECORD_HEADER.size
+        if offset + length > len(view):
+            return
+        yield timestamp, bytes(view[offset:offset + length])
+        offset += length
+
+
+def getCodec(codec: str) -> str:
+    '''
+        Returns the codec if it is available and falls back to zlib otherwise.
+    '''
+    if codec not in CODECS:
+        print(f"WARNING: Compression codec {codec} is not installed, using zlib")
+        return 'zlib'
+    return codec
+
+
+class BackgroundCompressor(object):
+    '''
+        Compresses and writes the blocks of all the recorders on a single thread.
+
+        The queue is bounded so a compressor that can not keep up does not use all the memory. The blocks that do not
+        fit in the queue are dropped and counted rather than blocking the subscriber threads.
+    '''
+    # How often the blocks of the quiet recorders are checked for their age, in seconds
+    flushCheckSeconds = 1
+
+    def __init__(self, maxQueuedBlocks: int = 256, retentionBytes: int | None = None, directory: str | None = None):
+        self.queue = queue.Queue(maxsize=maxQueuedBlocks)
+        self.retentionBytes = retentionBytes
+        self.directory = directory
+        self.recorders = set()
+        self.recordersLock = threading.Lock()
+        self.lastRetentionCheck = 0
+        self.lastFlushCheck = time.time()
+        self.droppedBlocks = 0
+        self.droppedRecords = 0
+        t = threading.Thread(target=self.__run, name='recording-compressor', daemon=True)
+        t.start()
+
+    def register(self, recorder: 'SegmentedRecorder') -> None:
+        '''
+            Adds a recorder to the ones whose partial blocks are flushed once they are older than their flushSeconds.
+        '''
+        with self.recordersLock:
+            self.recorders.add(recorder)
+
+    def submit(self, recorder: 'SegmentedRecorder', block: bytes, meta: Dict, wait: bool = False) -> bool:
+        '''
+            Queues a block. Unless wait is set, returns False and counts the block as dropped if the queue is full.
+        '''
+        recorder._addQueuedBlocks(1)
+        try:
+            self.queue.put((recorder, block, meta), block=wait)
+            return True
+        except queue.Full:
+            recorder._addQueuedBlocks(-1)
+            self.droppedBlocks += 1
+            self.droppedRecords += meta['records']
+            return False
+
+    def submitClose(self, recorder: 'SegmentedRecorder') -> None:
+        self.queue.put((recorder, None, None))
+
+    def getQueueDepth(self) -> int:
+        return self.queue.qsize()
+
+    def getDropped(self) -> Dict[str, int]:
+        return {'blocks': self.droppedBlocks, 'records': self.droppedRecords}
+
+    def enforceRetention(self) -> None:
+        '''
+            Deletes the oldest closed segments of every uuid until the recordings fit in the retention budget.
+        '''
+        if self.retentionBytes is None or self.directory is None or not os.path.isdir(self.directory):
+            return
+        with self.recordersLock:
+            openSegments = {recorder.segmentPath for recorder in self.recorders}
+        segments = []
+        total = 0
+        for uuid in os.listdir(self.directory):
+            for segment in listSegments(self.directory, uuid):
+                size = sum(os.path.getsize(path) for path in (segment, getIndexPath(segment)) if os.path.exists(path))
+                total += size
+                segments.append((os.path.basename(segment), segment, size))
+        # The file names are the start times so sorting them sorts the segments from the oldest
+        for _, segment, size in sorted(segments):
+            if total <= self.retentionBytes:
+                break
+            if segment in openSegments:
+                continue
+            for path in (segment, getIndexPath(segment)):
+                if os.path.exists(path):
+                    os.remove(path)
+            total -= size
+
+    def __run(self):
+        '''
+            This function is meant to be run in a thread and is not meant to be called directly.
+        '''
+        while True:
+            try:
+                recorder, block, meta = self.queue.get(timeout=self.flushCheckSeconds)
+            except queue.Empty:
+                recorder, block, meta = None, None, None
+            # This is the only compressor thread, an error must not stop it or the recorders fill the queue
+            try:
+                if recorder is not None:
+                    if block is None:
+                        recorder._closeSegment()
+                        with self.recordersLock:
+                            self.recorders.discard(recorder)
+                    else:
+                        try:
+                            self.__write(recorder, block, meta)
+                        finally:
+                            recorder._addQueuedBlocks(-1)
+                # Checked on every iteration, a busy queue must not hold back the blocks of the quiet recorders
+                if time.time() - self.lastFlushCheck >= self.flushCheckSeconds:
+                    self.lastFlushCheck = time.time()
+                    self.__flushStaleBlocks()
+                self.__checkRetention()
+            except Exception as e:
+                print(f"ERROR: Recording compressor failed: {e}")
+
+    def __flushStaleBlocks(self):
+        '''
+            Writes the blocks of the recorders that did not fill a block in flushSeconds so readers see them.
+        '''
+        with self.recordersLock:
+            recorders = list(self.recorders)
+        for recorder in recorders:
+            taken = recorder.takeBlock(maxAge=recorder.flushSeconds)
+            if taken is not None:
+                self.__write(recorder, *taken)
+
+    def __write(self, recorder: 'SegmentedRecorder', block: bytes, meta: Dict):
+        try:
+            if recorder._writeBlock(block, meta):
+                self.__checkRetention(force=True)
+        except OSError as e:
+            print(f"ERROR: Failed to write the recording of {recorder.uuid}: {e}")
+
+    def __checkRetention(self, force: bool = False):
+        if force or time.time() - self.lastRetentionCheck > 60:
+            self.lastRetentionCheck = time.time()
+            self.enforceRetention()
+
+
+class SegmentedRecorder(object):
+    '''
+        Records the messages of a uuid to rotating, block compressed segments.
+
+        write is called from the subscriber thread and only appends to the current block. Full blocks are handed to
+        the BackgroundCompressor which compresses them, writes them and rotates the segments. write never waits on
+        the compressor, a full block that does not fit in its queue is dropped.
+    '''
+    def __init__(self, directory: str, uuid: str, compressor: BackgroundCompressor, codec: str = 'zlib',
+                 blockBytes: int = 256 * 1024, segmentBytes: int = 64 * 1024 * 1024, segmentSeconds: float = 3600,
+                 flushSeconds: float = 5):
+        self.directory = os.path.join(directory, uuid)
+        self.uuid = uuid
+        self.compressor = compressor
+        self.codec = getCodec(codec)
+        self.blockBytes = blockBytes
+        self.segmentBytes = segmentBytes
+        self.segmentSeconds = segmentSeconds
+        self.flushSeconds = flushSeconds
+        self.lock = threading.Lock()
+        self.closed = False
+        # Blocks in the compressor queue, a partial block is only flushed by age once they are written
+        self.queuedBlocks = 0
+        self.queuedBlocksLock = threading.Lock()
+        self.__resetBlock()
+        # Only used by the compressor thread
+        self.segmentPath = None
+        self.segmentFile = None
+        self.indexFile = None
+        self.segmentStart = 0
+        os.makedirs(self.directory, exist_ok=True)
+        self.compressor.register(self)
+
+    def __resetBlock(self):
+        self.block = bytearray()
+        self.blockRecords = 0
+        self.blockFirstTime = None
+        self.blockLastTime = None
+        self.blockCreated = time.time()
+
+    def write(self, timestamp: float, message: ByteString) -> None:
+        if isinstance(message, str):
+            message = message.encode()
+        with self.lock:
+            if self.closed:
+                return
+            if self.blockFirstTime is None:
+                self.blockFirstTime = timestamp
+            self.blockLastTime = timestamp
+            self.blockRecords += 1
+            self.block += RECORD_HEADER.pack(timestamp, len(message))
+            self.block += message
+            if len(self.block) >= self.blockBytes:
+                # Submitted under the lock so the blocks reach the compressor in order
+                self.compressor.submit(self, *self.__takeBlock())
+
+    def takeBlock(self, maxAge: float = 0) -> Tuple[bytes, Dict] | None:
+        '''
+            Takes the current block if it is older than maxAge seconds, so messages on a quiet topic are not held back.
+        '''
+        with self.lock:
+            if self.blockRecords == 0 or time.time() - self.blockCreated < maxAge:
+                return None
+            # Writing it now would put it in the segment before the queued blocks
+            if self.queuedBlocks > 0:
+                return None
+            return self.__takeBlock()
+
+    def _addQueuedBlocks(self, count: int) -> None:
+        # A separate lock, close holds self.lock while it waits for room in the queue
+        with self.queuedBlocksLock:
+            self.queuedBlocks += count
+
+    def close(self) -> None:
+        '''
+            Flushes the last block and closes the segment once the compressor wrote everything before it.
+        '''
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            if self.blockRecords > 0:
+                # The last block waits for room in the queue rather than being dropped
+                self.compressor.submit(self, *self.__takeBlock(), wait=True)
+            self.compressor.submitClose(self)
+
+    def __takeBlock(self) -> Tuple[bytes, Dict]:
+        block = bytes(self.block)
+        meta = {'records': self.blockRecords, 'firstTime': self.blockFirstTime, 'lastTime': self.blockLastTime}
+        self.__resetBlock()
+        return block, meta
+
+    def _openSegment(self, startTime: float) -> None:
+        name = f'{int(startTime * 1e6):020d}'
+        self.segmentPath = os.path.join(self.directory, name + SEGMENT_SUFFIX)
+        self.segmentFile = open(self.segmentPath, 'ab')
+        self.indexFile = open(os.path.join(self.directory, name + INDEX_SUFFIX), 'a')
+        self.segmentStart = time.time()
+
+    def _closeSegment(self) -> None:
+        if self.segmentFile is None:
+            return
+        self.segmentFile.close()
+        self.indexFile.close()
+        self.segmentPath = None
+        self.segmentFile = None
+        self.indexFile = None
+
+    def _writeBlock(self, block: bytes, meta: Dict) -> bool:
+        '''
+            Compresses and appends a block to the current segment. Returns True if a segment was closed.
+
+            The block is written before its index line so a reader never finds an index entry without its data.
+
+            This function is only called from the compressor thread.
+        '''
+        compressed = CODECS[self.codec][0](block)
+        rotated = False
+        if self.segmentFile is not None and (self.segmentFile.tell() + len(compressed) > self.segmentBytes
+                                             or time.time() - self.segmentStart > self.segmentSeconds):
+            self._closeSegment()
+            rotated = True
+        if self.segmentFile is None:
+            self._openSegment(meta['firstTime'])
+        offset = self.segmentFile.tell()
+        self.segmentFile.write(compressed)
+        self.segmentFile.flush()
+        entry = dict(meta, offset=offset, length=len(compressed), rawLength=len(block), codec=self.codec)
+        self.indexFile.write(json.dumps(entry) + '\n')
+        self.indexFile.flush()
+        return rotated
+
+
+def getIndexPath(segment: str) -> str:
+    return segment[:-len(SEGMENT_SUFFIX)] + INDEX_SUFFIX
+
+
+def listSegments(directory: str, uuid: str) -> List[str]:
+    '''
+        Returns the segment files of a uuid from the oldest to the newest.
+    '''
+    uuidDirectory = os.path.join(directory, uuid)
+    if not os.path.isdir(uuidDirectory):
+        return []
+    return [os.path.join(uuidDirectory, name) for name in sorted(os.listdir(uuidDirectory)) if name.endswith(SEGMENT_SUFFIX)]
+
+
+class RecordingReader(object):
+    '''
+        Reads the segments of a uuid written by SegmentedRecorder.
+
+        The block indexes are used to skip the blocks outside of the requested time range without decompressing them.
+    '''
+    def __init__(self, directory: str, uuid: str):
+        self.directory = directory
+        self.uuid = uuid
+
+    def getSegments(self) -> List[str]:
+        return listSegments(self.directory, self.uuid)
+
+    def iterBlocks(self, startTime: float | None = None, endTime: float | None = None,
+                   reverse: bool = False) -> Iterator[Tuple[str, Dict]]:
+        '''
+            Yields (segment path, index entry) for the blocks that overlap the time range, the newest first if reverse.
+        '''
+        segments = self.getSegments()
+        for segment in reversed(segments) if reverse else segments:
+            try:
+                with open(getIndexPath(segment), 'r') as f:
+                    lines = f.readlines()
+            except FileNotFoundError:
+                # Deleted by the retention while we were reading
+                continue
+            for line in reversed(lines) if reverse else lines:
+                # The last line can be incomplete while the segment is being written
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if startTime is not None and entry['lastTime'] < startTime:
+                    continue
+                if endTime is not None and entry['firstTime'] > endTime:
+                    continue
+                yield segment, entry
+
+    def readBlock(self, segment: str, entry: Dict) -> bytes:
+        '''
+            Returns the decompressed records of a block.
+        '''
+        with open(segment, 'rb') as f:
+            f.seek(entry['offset'])
+            compressed = f.read(entry['length'])
+        return CODECS[entry['codec']][1](compressed)
+
+    def iterRecords(self, startTime: float | None = None, endTime: float | None = None,
+                    reverse: bool = False) -> Iterator[Tuple[float, bytes]]:
+        '''
+            Yields the (timestamp, message) records in the time range from the oldest to the newest, or from the
+            newest to the oldest if reverse. Only one block is held in memory either way.
+        '''
+        for segment, entry in self.iterBlocks(startTime, endTime, reverse):
+            try:
+                block = self.readBlock(segment, entry)
+            except FileNotFoundError:
+                continue
+            records = iterRecords(block)
+            for timestamp, message in reversed(list(records)) if reverse else records:
+                if startTime is not None and timestamp < startTime:
+                    continue
+                if endTime is not None and timestamp > endTime:
+                    continue
+                yield timestamp, message
@@ -0,0 +1,216 @@
+'''
+    Exports recordings to columnar files for offline analysis.
+
+    An export is a directory of memory mappable arrays, one row per recorded message:
+
+        timestamps.npy  float64, the time the message was received
+        sizes.npy       uint32, the payload size in bytes
+        topic_ids.npy   uint16, the index of the uuid in topics.json
+        offsets.npy     uint64, the offset of the payload in payload.bin
+        payload.bin     the payloads one after the other
+        topics.json     the uuids, indexed by the topic ids
+        recording.parquet (optional, needs pyarrow) the same columns plus the payload
+
+    The messages of each uuid are contiguous and in the order they were received. Use loadExport to map them back.
+
+    Usage: python -m src.recordingExport recordings exports/today --start 1700000000 --parquet
+'''
+import os
+import json
+import numpy as np
+from typing import List, Dict, Tuple
+
+from src.recording import RecordingReader, RECORD_HEADER, iterRecords, listSegments
+
+# Number of messages per parquet row group
+PARQUET_ROW_GROUP = 1024 * 1024
+
+
+def _planExport(reader: RecordingReader, startTime: float | None, endTime: float | None) -> Tuple[List, int, int]:
+    '''
+        Returns the blocks to export with the number of messages and payload bytes they hold.
+
+        The block index gives the counts of the blocks inside the time range, only the blocks that straddle the
+        start or the end have to be decompressed to count them.
+    '''
+    blocks = []
+    records = 0
+    payloadBytes = 0
+    for segment, entry in reader.iterBlocks(startTime, endTime):
+        partial = (startTime is not None and entry['firstTime'] < startTime) or (endTime is not None and entry['lastTime'] > endTime)
+        if partial:
+            try:
+                block = reader.readBlock(segment, entry)
+            except FileNotFoundError:
+                # Deleted by the retention while we were reading
+                continue
+            sizes = [len(message) for timestamp, message in iterRecords(block)
+                     if (startTime is None or timestamp >= startTime) and (endTime is None or timestamp <= endTime)]
+            records += len(sizes)
+            payloadBytes += sum(sizes)
+        else:
+            records += entry['records']
+            payloadBytes += entry['rawLength'] - entry['records'] * RECORD_HEADER.size
+        blocks.append((segment, entry))
+    return blocks, records, payloadBytes
+
+
+def _truncateColumn(path: str, rows: int) -> None:
+    '''
+        Rewrites a column with only its first rows, the shape in the header of a .npy file can not be changed in place.
+    '''
+    column = np.load(path, mmap_mode='r')
+    truncated = np.lib.format.open_memmap(path + '.tmp', mode='w+', dtype=column.dtype, shape=(rows,))
+    truncated[:] = column[:rows]
+    truncated.flush()
+    del column, truncated
+    os.replace(path + '.tmp', path)
+
+
+def exportRecordings(recordingDirectory: str, outputDirectory: str, uuids: List[str] | None = None,
+                     startTime: float | None = None, endTime: float | None = None, parquet: bool = False) -> Dict[str, any]:
+    '''
+        Exports the recordings of the uuids (all the recorded uuids by default) in the time range to outputDirectory.
+
+        The sizes of the arrays are known from the block indexes up front, so the columns are written straight into
+        memory mapped files and the export never holds more than one block in memory.
+    '''
+    if uuids is None:
+        uuids = sorted(uuid for uuid in os.listdir(recordingDirectory) if listSegments(recordingDirectory, uuid))
+    if len(uuids) > np.iinfo(np.uint16).max:
+        raise ValueError(f'Can not export more than {np.iinfo(np.uint16).max} uuids')
+    os.makedirs(outputDirectory, exist_ok=True)
+
+    plans = []
+    totalRecords = 0
+    for uuid in uuids:
+        blocks, records, payloadBytes = _planExport(RecordingReader(recordingDirectory, uuid), startTime, endTime)
+        plans.append((uuid, blocks, records, payloadBytes))
+        totalRecords += records
+
+    def openColumn(name, dtype):
+        return np.lib.format.open_memmap(os.path.join(outputDirectory, name), mode='w+', dtype=dtype, shape=(totalRecords,))
+
+    timestamps = openColumn('timestamps.npy', np.float64)
+    sizes = openColumn('sizes.npy', np.uint32)
+    topicIds = openColumn('topic_ids.npy', np.uint16)
+    offsets = openColumn('offsets.npy', np.uint64)
+
+    row = 0
+    payloadOffset = 0
+    missingBlocks = 0
+    with open(os.path.join(outputDirectory, 'payload.bin'), 'wb') as payload:
+        for topicId, (uuid, blocks, records, payloadBytes) in enumerate(plans):
+            reader = RecordingReader(recordingDirectory, uuid)
+            topicStart = row
+            for segment, entry in blocks:
+                try:
+                    block = reader.readBlock(segment, entry)
+                except FileNotFoundError:
+                    # The retention of a running monitor deletes the oldest segments, the ones exported first
+                    missingBlocks += 1
+                    continue
+                for timestamp, message in iterRecords(block):
+                    if (startTime is not None and timestamp < startTime) or (endTime is not None and timestamp > endTime):
+                        continue
+                    timestamps[row] = timestamp
+                    sizes[row] = len(message)
+                    offsets[row] = payloadOffset
+                    payload.write(message)
+                    payloadOffset += len(message)
+                    row += 1
+            topicIds[topicStart:row] = topicId
+
+    for column in (timestamps, sizes, topicIds, offsets):
+        column.flush()
+    if row < totalRecords:
+        print(f"WARNING: {missingBlocks} blocks ({totalRecords - row} messages) were deleted while exporting, they are left out")
+        del timestamps, sizes, topicIds, offsets
+        for name in ('timestamps.npy', 'sizes.npy', 'topic_ids.npy', 'offsets.npy'):
+            _truncateColumn(os.path.join(outputDirectory, name), row)
+    with open(os.path.join(outputDirectory, 'topics.json'), 'w') as f:
+        json.dump(uuids, f)
+
+    export = loadExport(outputDirectory)
+    if parquet:
+        writeParquet(export, os.path.join(outputDirectory, 'recording.parquet'))
+    return export
+
+
+def loadExport(directory: str) -> Dict[str, any]:
+    '''
+        Memory maps an export. The payload of message i is payload[offsets[i]:offsets[i] + sizes[i]].
+    '''
+    export = {name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r')
+              for name in ('timestamps', 'sizes', 'topic_ids', 'offsets')}
+    payloadPath = os.path.join(directory, 'payload.bin')
+    # numpy can not map an empty file
+    if os.path.getsize(payloadPath) > 0:
+        export['payload'] = np.memmap(payloadPath, dtype=np.uint8, mode='r')
+    else:
+        export['payload'] = np.zeros(0, dtype=np.uint8)
+    with open(os.path.join(directory, 'topics.json'), 'r') as f:
+        export['topics'] = json.load(f)
+    return export
+
+
+def getPayload(export: Dict[str, any], index: int) -> bytes:
+    offset = int(export['offsets'][index])
+    return export['payload'][offset:offset + int(export['sizes'][index])].tobytes()
+
+
+def writeParquet(export: Dict[str, any], path: str) -> None:
+    '''
+        Writes the export as a parquet file. The payload column is built on top of the mapped payload without copying it.
+    '''
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        print("WARNING: pyarrow is not installed, skipping the parquet export")
+        return
+    schema = pa.schema([
+        ('timestamp', pa.float64()),
+        ('size', pa.uint32()),
+        ('topic_id', pa.uint16()),
+        ('topic', pa.dictionary(pa.uint16(), pa.string())),
+        ('payload', pa.large_binary()),
+    ])
+    topics = pa.array(export['topics'], type=pa.string())
+    total = len(export['timestamps'])
+    with pq.ParquetWriter(path, schema) as writer:
+        for start in range(0, total, PARQUET_ROW_GROUP):
+            end = min(start + PARQUET_ROW_GROUP, total)
+            sizes = np.asarray(export['sizes'][start:end])
+            topicIds = np.asarray(export['topic_ids'][start:end])
+            first = int(export['offsets'][start])
+            last = first + int(sizes.sum())
+            # The payloads of a row group are contiguous, so the arrow offsets are just the running sizes
+            payloadOffsets = np.zeros(end - start + 1, dtype=np.int64)
+            np.cumsum(sizes, out=payloadOffsets[1:])
+            payloads = pa.LargeBinaryArray.from_buffers(pa.large_binary(), end - start, [
+                None, pa.py_buffer(payloadOffsets), pa.py_buffer(export['payload'][first:last])])
+            writer.write_table(pa.table([
+                pa.array(export['timestamps'][start:end]),
+                pa.array(sizes),
+                pa.array(topicIds),
+                pa.DictionaryArray.from_arrays(pa.array(topicIds), topics),
+                payloads,
+            ], schema=schema))
+
+
+def argParse():
+    import argparse
+    parser = argparse.ArgumentParser(description='Export ZMQ Message Viewer recordings to columnar files')
+    parser.add_argument('recording_dir', type=str, help='Directory the recordings were written to')
+    parser.add_argument('output_dir', type=str, help='Directory to write the export to')
+    parser.add_argument('--uuids', type=str, nargs='*', default=None, help='Only export these uuids')
+    parser.add_argument('--start', type=float, default=None, help='Only export the messages received after this unix time')
+    parser.add_argument('--end', type=float, default=None, help='Only export the messages received before this unix time')
+    parser.add_argument('--parquet', action='store_true', help='Also write a parquet file, needs pyarrow')
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = argParse()
+    export = exportRecordings(args.recording_dir, args.output_dir, args.uuids, args.start, args.end, args.parquet)
+    print(f"Exported {len(export['timestamps'])} messages from {len(export['topics'])} topics to {args.output_dir}")
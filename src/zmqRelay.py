@@ -0,0 +1,137 @@
+import zmq
+import time
+import queue
+import socket
+import threading
+from zmq.utils.monitor import recv_monitor_message
+from typing import Dict, List
+
+
+class ZmqRelay(object):
+    '''
+        Re-publishes the upstream publishers of the monitor on a local XPUB endpoint.
+
+        Downstream subscribers (other dashboards, scripts, recorders) connect to the relay instead of to the
+        publishers. Their subscriptions are forwarded upstream through an XSUB socket and the messages are relayed
+        without copying the frames, so the publishers carry a single extra connection no matter how many
+        subscribers there are.
+
+        All the sockets are owned by the relay thread, upstreams are handed to it through a queue.
+    '''
+    # Messages relayed per poll
+    maxBatch = 1000
+
+    def __init__(self, endpoint: str, pollTimeout: int = 100):
+        self.endpoint = endpoint
+        self.pollTimeout = pollTimeout
+        self.pendingUpstreams = queue.Queue()
+        self.upstreams = []
+        self.peers: Dict[int, Dict[str, any]] = {}
+        self.subscriptions: Dict[bytes, Dict[str, int]] = {}
+        self.messages = 0
+        self.payloadBytes = 0
+        self.lock = threading.Lock()
+        t = threading.Thread(target=self.__run, name='zmq-relay', daemon=True)
+        t.start()
+
+    def addUpstream(self, server_ip: str, port: str | int) -> None:
+        '''
+            Connects the relay to a publisher. Connecting to the same publisher twice is ignored.
+        '''
+        self.pendingUpstreams.put(f'tcp://{server_ip}:{port}')
+
+    def getMetrics(self) -> Dict[str, any]:
+        '''
+            Returns the relayed totals, the connected downstream peers and the messages relayed per subscription.
+        '''
+        with self.lock:
+            return {
+                'endpoint': self.endpoint,
+                'upstreams': list(self.upstreams),
+                'messages': self.messages,
+                'payload_bytes': self.payloadBytes,
+                'peers': [dict(peer) for peer in self.peers.values()],
+                'subscriptions': {topic.decode(errors='replace'): dict(stats) for topic, stats in self.subscriptions.items()},
+            }
+
+    def _getPeerAddress(self, fd: int) -> str:
+        try:
+            # fromfd duplicates the descriptor, closing it leaves the zmq connection alone
+            with socket.fromfd(fd, socket.AF_INET, socket.SOCK_STREAM) as peer:
+                address = peer.getpeername()
+            return f'{address[0]}:{address[1]}' if isinstance(address, tuple) else str(address)
+        except OSError:
+            return 'unknown'
+
+    def _handleMonitorEvent(self, event: Dict[str, any]) -> None:
+        fd = event['value']
+        with self.lock:
+            if event['event'] == zmq.EVENT_ACCEPTED:
+                self.peers[fd] = {'address': self._getPeerAddress(fd), 'connected': time.time(), 'disconnected': None}
+            elif event['event'] == zmq.EVENT_DISCONNECTED and fd in self.peers:
+                self.peers[fd]['disconnected'] = time.time()
+                # Only keep the peers that left recently around for the metrics
+                for oldFd in [oldFd for oldFd, peer in self.peers.items() if peer['disconnected'] and time.time() - peer['disconnected'] > 300]:
+                    del self.peers[oldFd]
+
+    def _handleSubscription(self, message: bytes) -> None:
+        # The first byte is 1 for a subscription and 0 for an unsubscription, the topic follows
+        subscribe, topic = message[0] == 1, message[1:]
+        with self.lock:
+            stats = self.subscriptions.setdefault(topic, {'subscribers': 0, 'messages': 0, 'payload_bytes': 0})
+            stats['subscribers'] = stats['subscribers'] + 1 if subscribe else max(stats['subscribers'] - 1, 0)
+            if stats['subscribers'] == 0:
+                del self.subscriptions[topic]
+
+    def _countMessage(self, frames: List[zmq.Frame]) -> None:
+        size = sum(len(frame) for frame in frames)
+        # Only the topic prefix is copied out of the frame
+        head = bytes(frames[0].buffer[:max((len(topic) for topic in self.subscriptions), default=0)])
+        with self.lock:
+            self.messages += 1
+            self.payloadBytes += size
+            for topic, stats in self.subscriptions.items():
+                if head.startswith(topic):
+                    stats['messages'] += 1
+                    stats['payload_bytes'] += size
+
+    def __run(self):
+        '''
+            This function is meant to be run in a thread and is not meant to be called directly.
+        '''
+        context = zmq.Context.instance()
+        xsub = context.socket(zmq.XSUB)
+        xpub = context.socket(zmq.XPUB)
+        # Pass every subscription and unsubscription upstream so the per topic subscriber counts are exact
+        xpub.setsockopt(zmq.XPUB_VERBOSER, 1)
+        xpub.bind(self.endpoint)
+        monitor = xpub.get_monitor_socket(zmq.EVENT_ACCEPTED | zmq.EVENT_DISCONNECTED)
+        poller = zmq.Poller()
+        poller.register(xsub, zmq.POLLIN)
+        poller.register(xpub, zmq.POLLIN)
+        poller.register(monitor, zmq.POLLIN)
+        while True:
+            while not self.pendingUpstreams.empty():
+                upstream = self.pendingUpstreams.get()
+                if upstream not in self.upstreams:
+                    # XSUB replays the current subscriptions to the new publisher
+                    xsub.connect(upstream)
+                    with self.lock:
+                        self.upstreams.append(upstream)
+            events = dict(poller.poll(self.pollTimeout))
+            if xsub in events:
+                # Drain what is queued so a busy publisher does not cost one poll per message
+                for _ in range(self.maxBatch):
+                    try:
+                        frames = xsub.recv_multipart(zmq.NOBLOCK, copy=False)
+                    except zmq.Again:
+                        break
+                    xpub.send_multipart(frames, copy=False)
+                    self._countMessage(frames)
+            if xpub in events:
+                message = xpub.recv()
+                xsub.send(message)
+                if len(message) > 0 and message[0] in (0, 1):
+                    self._handleSubscription(message)
+            if monitor in events:
+                self._handleMonitorEvent(recv_monitor_message(monitor))
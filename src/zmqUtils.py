@@ -5,23 +5,47 @@ from typing import Callable, List, Dict, ByteString
 
 from collections import deque
 
+from src.recording import BackgroundCompressor, SegmentedRecorder, RecordingReader
+from src.diagnostics import Diagnostics
+from src.metricsStore import MetricsStore
+from src.zmqRelay import ZmqRelay
+
 class ZmqSubscriber(object):
     '''
         Implements a zmq subscriber that subscribes to a list of servers and topics.
 
         This class is a singleton.
     '''
+    # Number of messages kept per uuid for searching recent history
+    messageHistoryLength = 1000
+
     def __init__(self):
+        # The pages construct the singleton again on import, do not reset the state when they do
+        if getattr(self, '_initialized', False):
+            return
+        self._initialized = True
         self.zmqServerPortTopics = []
         self.zmqMostRecentData = {}
+        self.zmqMessageHistory = {}
+        self.zmqSequenceNumbers = {}
         self.zmqMetrics = {}
         self.zmqRecordingUUIDs = []
+        self.zmqRecorders = {}
+        self.recordingCompressor = None
+        self.configureRecording()
         self.threads = []
         self.metricsHistry = {}
         self.dataTypeDict = {}
         self.metrics = {}
+        self.metricsGeneration = 0
+        self.metricsStore = None
+        self.relay = None
+        self.diagnostics = Diagnostics()
+        self.diagnostics.registerGauge('recording_compressor_queue', self.recordingCompressor.getQueueDepth)
+        self.diagnostics.registerGauge('recording_dropped', self.recordingCompressor.getDropped)
+        self.diagnostics.registerGauge('recording_uuids', lambda: list(self.zmqRecordingUUIDs))
         # Spawn a thread to calculate the average metrics
-        t = threading.Thread(target=self.__calculateAverageMetrics)
+        t = threading.Thread(target=self.__calculateAverageMetrics, name='zmq-metrics')
         t.start()
 
     def __new__(cls):
@@ -32,13 +56,54 @@ class ZmqSubscriber(object):
             cls.instance = super(ZmqSubscriber, cls).__new__(cls)
         return cls.instance
 
-    def _recordMessage(self, uuid: str, message: ByteString):
+    def configureRecording(self, directory: str = 'recordings', codec: str = 'zlib', blockBytes: int = 256 * 1024,
+                           segmentBytes: int = 64 * 1024 * 1024, segmentSeconds: float = 3600,
+                           retentionBytes: int | None = None) -> None:
+        '''
+            Configures where and how the recordings are written. Applies to the recordings started afterwards.
+
+            When retentionBytes is set, the oldest segments are deleted once the recordings use more disk than that.
         '''
-            TODO: I should probably add a timestamp to thet datastream for playback purposes.
+        self.recordingConfig = {'directory': directory, 'codec': codec, 'blockBytes': blockBytes,
+                                'segmentBytes': segmentBytes, 'segmentSeconds': segmentSeconds}
+        if self.recordingCompressor is not None:
+            self.recordingCompressor.directory = directory
+            self.recordingCompressor.retentionBytes = retentionBytes
+        else:
+            self.recordingCompressor = BackgroundCompressor(retentionBytes=retentionBytes, directory=directory)
+
+    def configureMetricsStore(self, path: str | None) -> None:
         '''
-        with open(f'{uuid}.txt', 'ab') as f:
-            f.write(f'!Q{len(message)}'.encode())
-            f.wrie(message)
+            Persists the metrics to a SQLite database at path so the history survives restarts. None disables it.
+        '''
+        self.metricsStore = MetricsStore(path) if path else None
+
+    def enableRelay(self, endpoint: str) -> None:
+        '''
+            Re-publishes the subscribed servers on a local XPUB endpoint (e.g. tcp://*:6000) so other tools can
+            subscribe to the monitor instead of to the servers.
+        '''
+        if self.relay is not None:
+            print(f"ERROR: The relay is already enabled on {self.relay.endpoint}")
+            return
+        self.relay = ZmqRelay(endpoint)
+        for serverPortTopic in self.zmqServerPortTopics:
+            self.relay.addUpstream(serverPortTopic['ip'], serverPortTopic['port'])
+        self.diagnostics.registerGauge('relay', self.relay.getMetrics)
+
+    def getRecordingReader(self, uuid: str) -> RecordingReader:
+        '''
+            This function returns a reader over the recorded segments of a uuid.
+        '''
+        return RecordingReader(self.recordingConfig['directory'], uuid)
+
+    def _recordMessage(self, uuid: str, message: ByteString, timestamp: float):
+        '''
+            Appends the message to the recording. The compression and the writes are done by the compressor thread.
+        '''
+        recorder = self.zmqRecorders.get(uuid, None)
+        if recorder is not None:
+            recorder.write(timestamp, message)
 
     def _subscribeToServer(self, server_ip, port, topic, uuid):
         '''
@@ -57,17 +122,27 @@ class ZmqSubscriber(object):
         
         self.zmqMetrics[uuid] = {'message_count':0, 'start_time':time.time(), 'payload_bytes':0}
 
+        loopName = f'ingest:{uuid}'
         while True:
             message = subscriber.recv_string()
+            # Only the handling of the message is timed, not the wait for it
+            start = time.perf_counter()
+            startCpu = time.thread_time()
+            # The sequence number lets the pages skip refreshing when nothing new arrived
+            self.zmqSequenceNumbers[uuid] = self.zmqSequenceNumbers.get(uuid, 0) + 1
             #Place the message and the time it was received in the most recent data dictionary
-            self.zmqMostRecentData[uuid] = {'message': message, 'time': time.time()}
+            data = {'message': message, 'time': time.time(), 'sequence': self.zmqSequenceNumbers[uuid]}
+            self.zmqMostRecentData[uuid] = data
+            # Keep the message in the history so it can be searched
+            self.zmqMessageHistory[uuid].append(data)
             # Increment the number of messages received
             self.zmqMetrics[uuid]['message_count'] += 1
             # Increment the number of bytes received
             self.zmqMetrics[uuid]['payload_bytes'] += len(message)
             # If the uuid is being recorded, then write the message to a file
             if uuid in self.zmqRecordingUUIDs:
-                self._recordMessage(uuid, message)
+                self._recordMessage(uuid, message, data['time'])
+            self.diagnostics.recordLoop(loopName, time.perf_counter() - start, time.thread_time() - startCpu)
 
     def _crafteUUID(self, server_ip, port, topic):
         return f'{server_ip}-{port}-{topic}'
@@ -106,12 +181,15 @@ class ZmqSubscriber(object):
             print(f"ERROR: UUID {uuid} already exists in the dictionary")
             return uuid
         self.metricsHistry[uuid] = deque(maxlen=10)
+        self.zmqMessageHistory[uuid] = deque(maxlen=self.messageHistoryLength)
         self.dataTypeDict[uuid] = data_type
         self.zmqServerPortTopics.append({'ip':server_ip, 'port':port, 'topic':topic, 'dataType': data_type, 'uuid':uuid})
         # Start a thread to subscribe to the server and topic
-        t = threading.Thread(target=self._subscribeToServer, args=(server_ip, port, topic, uuid))
+        t = threading.Thread(target=self._subscribeToServer, args=(server_ip, port, topic, uuid), name=f'zmq-{uuid}')
         t.start()
         self.threads.append(t)
+        if self.relay is not None:
+            self.relay.addUpstream(server_ip, port)
         return uuid
     
     def lookupUUID(self, server_ip: str, port: str | int, topic: str) -> str:
@@ -144,6 +222,29 @@ class ZmqSubscriber(object):
         # If it is not, then return None
         return self.zmqMostRecentData.get(uuid, None)
     
+    def getSequenceNumber(self, uuid) -> int:
+        '''
+            This function returns the number of messages received for a uuid. It changes whenever new data arrived.
+        '''
+        return self.zmqSequenceNumbers.get(uuid, 0)
+
+    def getMetricsGeneration(self) -> int:
+        '''
+            This function returns a counter that is incremented every time the metrics are recalculated.
+        '''
+        return self.metricsGeneration
+
+    def getMessageHistory(self, uuid) -> List[Dict[str, any]]:
+        '''
+            This function returns a snapshot of the recent messages for a uuid, oldest first.
+
+            The copy is taken in a single call so the subscriber thread is never blocked by the caller.
+        '''
+        history = self.zmqMessageHistory.get(uuid, None)
+        if history is None:
+            return []
+        return list(history)
+
     def getMostRecentDataAll(self) -> Dict[str, any]:
         '''
             This function returns the most recent data for all uuids.
@@ -177,9 +278,16 @@ class ZmqSubscriber(object):
         previous_time = time.time()
         while True:
             time.sleep(1)
-            time_delta = time.time() - previous_time
+            start = time.perf_counter()
+            startCpu = time.thread_time()
+            now = time.time()
+            time_delta = now - previous_time
+            metricsStore = self.metricsStore
             # Update the metrics for each uuid
             for uuid in self.getUUIDs():
+                # The subscriber thread may not have started yet
+                if uuid not in self.zmqMetrics:
+                    continue
                 message_rate = self.zmqMetrics[uuid]['message_count'] / time_delta
                 payload_rate = self.zmqMetrics[uuid]['payload_bytes'] / 1024 / time_delta
                 self.metrics[uuid] = {
@@ -190,10 +298,33 @@ class ZmqSubscriber(object):
                 }
                 self.zmqMetrics[uuid]['message_count'] = 0
                 self.zmqMetrics[uuid]['payload_bytes'] = 0
+                if metricsStore is not None:
+                    metricsStore.add(uuid, now, message_rate, payload_rate)
+            self.metricsGeneration += 1
+            if metricsStore is not None:
+                metricsStore.flushIfDue()
             previous_time = time.time()
+            self.diagnostics.recordLoop('metrics', time.perf_counter() - start, time.thread_time() - startCpu)
     
+    def getMetricsHistory(self, uuids: List[str], startTime: float, endTime: float | None = None,
+                          maxPoints: int | None = None) -> Dict[str, List]:
+        '''
+            This function returns the persisted (time, message_rate, payload_rate) samples of the uuids.
+            Returns empty histories when no metrics store is configured.
+        '''
+        if self.metricsStore is None:
+            return {uuid: [] for uuid in uuids}
+        return self.metricsStore.query(uuids, startTime, endTime, maxPoints)
+
     def startRecording(self, uuid: str) -> None:
+        if uuid in self.zmqRecorders:
+            return
+        self.zmqRecorders[uuid] = SegmentedRecorder(uuid=uuid, compressor=self.recordingCompressor, **self.recordingConfig)
         self.zmqRecordingUUIDs.append(uuid)
 
     def stopRecording(self, uuid: str) -> None:
-        self.zmqRecordingUUIDs.remove(uuid)
\ No newline at end of file
+        recorder = self.zmqRecorders.pop(uuid, None)
+        if recorder is None:
+            return
+        self.zmqRecordingUUIDs.remove(uuid)
+        recorder.close()
\ No newline at end of file